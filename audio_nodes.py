@@ -1,10 +1,13 @@
 import os
+import time
 
 import folder_paths
 import numpy as np
 import torch
 from pydub import AudioSegment
 
+from .save_utils import COUNTER_INDEX, SHARD_LAYOUTS, shard_subfolder
+
 
 class SaveAudioAsMP3_Custom:
     def __init__(self):
@@ -18,6 +21,16 @@ class SaveAudioAsMP3_Custom:
                 "filename": ("STRING", {"default": "audio_output"}),
                 "path": ("STRING", {"default": ""}),
                 "quality": (["320k", "256k", "192k", "128k", "64k"], {"default": "192k"})
+            },
+            "optional": {
+                "shard_layout": (SHARD_LAYOUTS, {
+                    "default": "none",
+                    "tooltip": "Distribute files over subfolders: by date, by counter bucket or by filename hash prefix"
+                }),
+                "shard_size": ("INT", {
+                    "default": 1000, "min": 1, "max": 1000000, "step": 1,
+                    "tooltip": "Files per subfolder for shard_layout = counter_bucket"
+                }),
             }
         }
 
@@ -26,7 +39,7 @@ class SaveAudioAsMP3_Custom:
     OUTPUT_NODE = True
     CATEGORY = "Audio/Custom"
 
-    def save_audio(self, audio, filename, path, quality):
+    def save_audio(self, audio, filename, path, quality, shard_layout="none", shard_size=1000):
         # 1. Path Resolution
         if path.strip() == "":
             dest_dir = self.output_dir
@@ -47,6 +60,41 @@ class SaveAudioAsMP3_Custom:
         # 3. Batch Processing Loop
         # Waveform shape is (batch, channels, samples)
         batch_size = waveform.shape[0]
+
+        # Overwrite protection via the persistent counter index. Names not yet
+        # indexed are seeded by probing (one stat for a fresh name, never a
+        # directory listing); only names that repeat are written to the index.
+        def mp3_name(base_name, counter):
+            if counter == 0:
+                return f"{base_name}.mp3"
+            return f"{base_name}_{counter}.mp3"
+
+        def seed_counter(target_dir, base_name):
+            # Same rule as before: first free name in <base>.mp3, <base>_1.mp3, ...
+            counter = 0
+            while os.path.exists(os.path.join(target_dir, mp3_name(base_name, counter))):
+                counter += 1
+            return counter
+
+        # Sharding: counter buckets need a running file sequence per folder,
+        # reserved once for the whole batch
+        shard_date = time.strftime("%Y-%m-%d")
+        sequence_start = 0
+        if shard_layout == "counter_bucket":
+            def count_sharded_files():
+                return sum(
+                    sum(1 for name in os.listdir(entry.path) if name.endswith(".mp3"))
+                    for entry in os.scandir(dest_dir)
+                    if entry.is_dir() and not entry.name.startswith(".")
+                )
+
+            sequence_start = COUNTER_INDEX.reserve(
+                dest_dir,
+                "mp3:__sequence__",
+                batch_size,
+                seed=count_sharded_files,
+                is_taken=lambda c: False,
+            )
         
         for i in range(batch_size):
             # Extract single slice:
@@ -83,13 +131,25 @@ class SaveAudioAsMP3_Custom:
             if batch_size > 1:
                 current_filename = f"{filename}_{i+1:03d}"
                 
+            # Sharded target folder
+            shard = shard_subfolder(
+                shard_layout, sequence_start + i, current_filename, shard_size, shard_date
+            )
+            target_dir = os.path.join(dest_dir, shard)
+            if shard:
+                os.makedirs(target_dir, exist_ok=True)
+
             # Overwrite protection
-            full_path = os.path.join(dest_dir, f"{current_filename}.mp3")
-            counter = 1
             base_name = current_filename
-            while os.path.exists(full_path):
-                full_path = os.path.join(dest_dir, f"{base_name}_{counter}.mp3")
-                counter += 1
+            counter = COUNTER_INDEX.reserve(
+                dest_dir,
+                f"mp3:{shard}/{base_name}" if shard else f"mp3:{base_name}",
+                1,
+                seed=lambda: seed_counter(target_dir, base_name),
+                is_taken=lambda c: os.path.exists(os.path.join(target_dir, mp3_name(base_name, c))),
+                index_fresh=False,
+            )
+            full_path = os.path.join(target_dir, mp3_name(base_name, counter))
                 
             # 8. Export
             print(f" Saving to: {full_path} at {quality}")
@@ -0,0 +1,83 @@
+# ComfyUI - Megapixel Resize Benchmark - Elmar Krüger - 2026
+#
+# Compares the resize methods of MegapixelResizeNode on CPU for large
+# reductions (e.g. 36 MP photos down to 1 MP): wall time per batch and PSNR
+# against single-pass lanczos as the quality reference.
+#
+# Run from the ComfyUI root directory (comfy.utils must be importable):
+#   python custom_nodes/My_Utility_Nodes/benchmarks/pyramid_resize_benchmark.py
+#   python custom_nodes/My_Utility_Nodes/benchmarks/pyramid_resize_benchmark.py photo.jpg --target-mp 1.0
+import argparse
+import importlib
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.dirname(PACKAGE_DIR))
+image_nodes = importlib.import_module(f"{os.path.basename(PACKAGE_DIR)}.image_nodes")
+
+METHODS = ["lanczos", "area-pyramid", "area", "bicubic", "bilinear"]
+
+
+def synthetic_image(width, height, seed=0):
+    """Smooth gradients plus fine detail and a zone plate, so aliasing shows up in PSNR."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    r2 = ((x - width / 2) ** 2 + (y - height / 2) ** 2) / max(width, height) ** 2
+    zone = 0.5 + 0.5 * np.cos(400.0 * r2)
+    gradient = x / width
+    noise = rng.random((height, width), dtype=np.float32)
+    img = np.stack([zone, gradient, 0.7 * zone + 0.3 * noise], axis=-1)
+    return torch.from_numpy(img).unsqueeze(0)
+
+
+def load_image(path):
+    img = Image.open(path).convert("RGB")
+    return torch.from_numpy(np.asarray(img).astype(np.float32) / 255.0).unsqueeze(0)
+
+
+def psnr(a, b):
+    mse = torch.mean((a.float() - b.float()) ** 2).item()
+    return float("inf") if mse == 0 else 10.0 * math.log10(1.0 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MegapixelResizeNode resize method benchmark")
+    parser.add_argument("image", nargs="?", help="source image (default: synthetic 7360x4912 test pattern)")
+    parser.add_argument("--target-mp", type=float, default=1.0)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    image = load_image(args.image) if args.image else synthetic_image(7360, 4912)
+    image = image.repeat(args.batch, 1, 1, 1)
+    node = image_nodes.MegapixelResizeNode()
+    torch.set_grad_enabled(False)
+
+    results = {}
+    for method in METHODS:
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            out, width, height = node._resize_batch(image, args.target_mp, method, memory_budget_mb=0)
+            timings.append(time.perf_counter() - start)
+        results[method] = (min(timings), out)
+
+    reference = results["lanczos"][1]
+    print(f"Source {image.shape[2]}x{image.shape[1]} x{image.shape[0]} -> {width}x{height}")
+    print(f"{'method':<14}{'time (s)':>10}{'speedup':>10}{'PSNR vs lanczos (dB)':>24}")
+    base_time = results["lanczos"][0]
+    for method in METHODS:
+        seconds, out = results[method]
+        print(f"{method:<14}{seconds:>10.3f}{base_time / seconds:>9.1f}x{psnr(out, reference):>24.2f}")
+
+
+if __name__ == "__main__":
+    main()
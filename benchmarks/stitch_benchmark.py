@@ -0,0 +1,60 @@
+# ComfyUI - Image Stitch Benchmark - Elmar Krüger - 2026
+#
+# Compares the "tensor" and "pil" engines of MyImageStitch on CPU: wall time
+# for 10 inputs at 4K (mixed sizes, so half of the inputs have to be resized)
+# and the mean absolute difference between both results.
+#
+# Run from the ComfyUI root directory (comfy.utils must be importable):
+#   python custom_nodes/My_Utility_Nodes/benchmarks/stitch_benchmark.py
+#   python custom_nodes/My_Utility_Nodes/benchmarks/stitch_benchmark.py --inputs 10 --layout Vertical
+import argparse
+import importlib
+import os
+import sys
+import time
+
+import torch
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.dirname(PACKAGE_DIR))
+image_nodes = importlib.import_module(f"{os.path.basename(PACKAGE_DIR)}.image_nodes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MyImageStitch engine benchmark")
+    parser.add_argument("--inputs", type=int, default=10, choices=range(1, 11))
+    parser.add_argument("--layout", default="Horizontal", choices=["Horizontal", "Vertical"])
+    parser.add_argument("--padding", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    torch.set_grad_enabled(False)
+    # 4K UHD frames; every other input is slightly smaller, so it gets rescaled
+    images = {}
+    for i in range(1, args.inputs + 1):
+        h, w = (2160, 3840) if i % 2 else (2000, 3600)
+        images[f"image_{i}"] = torch.rand(1, h, w, 3)
+
+    node = image_nodes.MyImageStitch()
+    results = {}
+    for engine in ("pil", "tensor"):
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            out = node.stitch(args.layout, args.padding, "[]", engine=engine, **images)[0]
+            timings.append(time.perf_counter() - start)
+        results[engine] = (min(timings), out)
+
+    pil_time, pil_out = results["pil"]
+    tensor_time, tensor_out = results["tensor"]
+    print(f"{args.inputs} x 4K inputs, layout {args.layout}, output {tuple(tensor_out.shape)}")
+    print(f"{'engine':<10}{'time (s)':>10}{'speedup':>10}")
+    print(f"{'pil':<10}{pil_time:>10.3f}{1.0:>9.1f}x")
+    print(f"{'tensor':<10}{tensor_time:>10.3f}{pil_time / tensor_time:>9.1f}x")
+    print(f"mean |pil - tensor|: {(pil_out - tensor_out).abs().mean().item():.5f}")
+
+
+if __name__ == "__main__":
+    main()
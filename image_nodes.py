@@ -1,8 +1,14 @@
 # ComfyUI - Image Processing Nodes - Elmar Krüger - 2025
+import concurrent.futures
 import hashlib
+import io
 import json
 import math
+import multiprocessing
 import os
+import tempfile
+import time
+from collections import deque
 
 import comfy.utils
 import folder_paths
@@ -15,6 +21,51 @@ try:
 except ImportError:
     PromptServer = None
 from PIL.PngImagePlugin import PngInfo
+from comfy_execution.graph import ExecutionBlocker
+
+from .iterator_utils import (CACHE_DIRNAME, THUMBNAIL_SUBFOLDER, CoalescedEventSender,
+                             DirectoryIndex, ImagePack, ProcessedManifest, ThumbnailCache)
+from .save_utils import (COUNTER_INDEX, ENCODER_PROFILES, JPEG_EXIF_MAX_BYTES,
+                         METADATA_REF_KEY, SAVE_QUEUE, SHARD_LAYOUTS, SIDECAR_MODES,
+                         SIDECAR_PNG_KEY, benchmark_encoder_profiles,
+                         build_sidecar_exif, encoder_params,
+                         format_benchmark_table,
+                         get_tar_shard_writer, resolve_save_prefix,
+                         scan_save_counter, serialize_metadata,
+                         shard_subfolder, store_metadata)
+
+
+def _images_to_uint8(images):
+    """
+    Quantizes a [B,H,W,C] float image batch to a contiguous uint8 numpy array.
+
+    Clamping, scaling and the uint8 cast run in one pass on the tensor's own
+    device, followed by a single device-to-host transfer for the whole batch.
+    Truncation matches the former per-image `np.clip(255 * x).astype(np.uint8)`,
+    so saved pixels are bit-identical. Indexing the result yields per-image views.
+    """
+    if images.dtype == torch.uint8:
+        # Compact iterator output: already quantized
+        return images.contiguous().cpu().numpy()
+    if images.dtype in (torch.float16, torch.bfloat16):
+        # Half precision cannot hold k/255 exactly; rounding recovers the source value
+        frames = (images.float() * 255.0).round_().clamp_(0, 255).to(torch.uint8)
+        return frames.cpu().numpy()
+    frames = (images * 255.0).clamp_(0, 255).to(torch.uint8)
+    return frames.cpu().numpy()
+
+
+def _as_float_image(images):
+    """
+    Converts compact IMAGE tensors (uint8 / float16, see DirectoryImageIterator's
+    output_dtype) to the standard float32 [0,1] layout. float32 input is returned
+    unchanged, so the conversion only costs memory where it is actually needed.
+    """
+    if images.dtype == torch.uint8:
+        return images.to(torch.float32).div_(255.0)
+    if images.dtype in (torch.float16, torch.bfloat16):
+        return images.float()
+    return images
 
 
 class RGBA_to_RGB_Lossless:
@@ -40,8 +91,29 @@ class RGBA_to_RGB_Lossless:
                 # ("IMAGE",) definiert den Datentyp und erzwingt Typensicherheit
                 "image": ("IMAGE",),
             },
+            "optional": {
+                # drop: Alpha verwerfen (Zero-Copy); composite_*: über Hintergrund blenden
+                "alpha_mode": (["drop", "composite_straight", "composite_premultiplied"], {
+                    "default": "drop",
+                    "tooltip": "drop = Alpha verwerfen; composite = über Hintergrundfarbe/-bild blenden "
+                               "(straight bzw. premultiplied Alpha)"
+                }),
+                "background_color": ("STRING", {
+                    "default": "#000000",
+                    "tooltip": "Hintergrundfarbe (#RRGGBB) für die composite-Modi"
+                }),
+                # Optionales Hintergrundbild; hat Vorrang vor background_color
+                "background": ("IMAGE",),
+                "make_contiguous": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "Views (Alpha-Slice, Graustufen-Expand) als zusammenhängenden Speicher ausgeben"
+                }),
+            },
         }
 
+    # Grenze für temporäre Puffer je Verarbeitungsblock im Composite-Modus
+    COMPOSITE_CHUNK_BYTES = 256 * 1024 * 1024
+
     # Definition der Rückgabewerte
     # WICHTIG: Das Komma ist essenziell, um ein Python-Tupel zu erzeugen!
     RETURN_TYPES = ("IMAGE",)
@@ -55,13 +127,19 @@ class RGBA_to_RGB_Lossless:
     # Gruppierung im Kontextmenü des Node-Graphen
     CATEGORY = "Bildverarbeitung/Konvertierung"
 
-    def convert_rgba_to_rgb(self, image):
+    def convert_rgba_to_rgb(self, image, alpha_mode="drop", background_color="#000000",
+                            background=None, make_contiguous=False):
         """
         Führt die Konvertierung auf Tensor-Ebene durch.
 
         Args:
-            image (torch.Tensor): Ein Tensor der Form.
+            image (torch.Tensor): Ein Tensor der Form [B,H,W,C].
                                   B=Batch, H=Höhe, W=Breite, C=Kanäle.
+            alpha_mode (str): "drop" verwirft Alpha, "composite_straight" bzw.
+                              "composite_premultiplied" blenden über den Hintergrund.
+            background_color (str): Hintergrundfarbe als #RRGGBB.
+            background (torch.Tensor): Optionales Hintergrundbild [B,H,W,C].
+            make_contiguous (bool): Views als zusammenhängenden Speicher ausgeben.
 
         Returns:
             tuple: Ein Tupel enthaltend den modifizierten Tensor.
@@ -71,7 +149,12 @@ class RGBA_to_RGB_Lossless:
         # image.shape gibt ein torch.Size Objekt zurück, z.B.
         batch_size, height, width, channels = image.shape
 
-        # 2. Bedingte Logik basierend auf der Kanal-Tiefe
+        # 2. Compositing: nur sinnvoll, wenn ein Alpha-Kanal vorhanden ist
+        # (RGBA oder Graustufen mit Alpha)
+        if alpha_mode != "drop" and channels in (2, 4):
+            return (self._composite(image, alpha_mode, background_color, background),)
+
+        # 3. Bedingte Logik basierend auf der Kanal-Tiefe
         if channels == 4:
             # HAUPTFALL: RGBA Input
             # Wir nutzen Python Slicing (View-Operation).
@@ -82,6 +165,8 @@ class RGBA_to_RGB_Lossless:
 
             # Dies ist eine "Zero-Copy" Operation in PyTorch (View),
             # daher extrem speichereffizient und schnell.
+            if make_contiguous:
+                rgb_image = rgb_image.contiguous()
             return (rgb_image,)
 
         elif channels == 3:
@@ -89,28 +174,99 @@ class RGBA_to_RGB_Lossless:
             # Wir geben das Bild unverändert weiter, um Fehler zu vermeiden.
             return (image,)
 
-        elif channels == 1:
-            # SONDERFALL: Graustufen (Grayscale)
+        elif channels in (1, 2):
+            # SONDERFALL: Graustufen (Grayscale), ggf. mit Alpha
             # Manche Masken kommen als 1-Kanal Bilder.
-            # .repeat(1, 1, 1, 3) repliziert den Kanal 3x, um RGB zu simulieren.
-            # Dimensionen: Batch(1) * Height(1) * Width(1) * Channels(3)
-            rgb_image = image.repeat(1, 1, 1, 3)
+            # .expand() erzeugt eine View mit Stride 0 über den Kanal, statt den
+            # ganzen Batch wie .repeat() dreifach zu kopieren. Nur auf Wunsch
+            # (make_contiguous) wird ein zusammenhängender Tensor erzeugt.
+            rgb_image = image[..., :1].expand(batch_size, height, width, 3)
+            if make_contiguous:
+                rgb_image = rgb_image.contiguous()
             return (rgb_image,)
 
         else:
-            # FEHLERFALL: Unbekannte Kanalanzahl (z.B. 2 oder >4)
+            # FEHLERFALL: Unbekannte Kanalanzahl (z.B. >4)
             # Wir geben das Original zurück, könnten hier aber auch einen Error raisen.
             print(
                 f"Warnung: RGBA_to_RGB_Lossless erhielt Bild mit {channels} Kanälen. Keine Konvertierung möglich."
             )
             return (image,)
 
+    @staticmethod
+    def _parse_color(value):
+        """#RRGGBB -> (r, g, b) im Bereich 0..1; ungültige Werte ergeben Schwarz."""
+        text = str(value).strip().lstrip("#")
+        try:
+            if len(text) != 6:
+                raise ValueError(value)
+            return tuple(int(text[i:i + 2], 16) / 255.0 for i in (0, 2, 4))
+        except ValueError:
+            print(f"Warnung: RGBA_to_RGB_Lossless: ungültige Hintergrundfarbe '{value}', verwende Schwarz.")
+            return (0.0, 0.0, 0.0)
+
+    def _composite(self, image, alpha_mode, background_color, background):
+        """
+        Blendet über Hintergrundfarbe oder -bild in einem fusionierten Durchlauf je
+        Block von Frames direkt in einen einzigen, vorab allozierten Ausgabepuffer:
+            straight:       out = bg + a * (fg - bg)
+            premultiplied:  out = fg + (1 - a) * bg
+        Temporäre Tensoren existieren nur in Blockgröße, so bleibt auch ein
+        500-Frame-Video bei genau einem Ausgabepuffer.
+        """
+        batch_size, height, width, channels = image.shape
+        frame_bytes = height * width * 3 * 4
+        chunk = max(1, self.COMPOSITE_CHUNK_BYTES // (3 * frame_bytes))
+
+        if background is not None:
+            bg_image = background
+            if bg_image.shape[1:3] != (height, width):
+                # Hintergrundbild auf die Bildgröße bringen (einmalig)
+                bg_image = comfy.utils.common_upscale(
+                    _as_float_image(bg_image).movedim(-1, 1), width, height, "bilinear", crop="center"
+                ).movedim(1, -1)
+            bg_color = None
+        else:
+            bg_image = None
+            bg_color = torch.tensor(self._parse_color(background_color), dtype=torch.float32,
+                                    device=image.device)
+
+        out = torch.empty((batch_size, height, width, 3), dtype=torch.float32, device=image.device)
+        for start in range(0, batch_size, chunk):
+            stop = min(batch_size, start + chunk)
+            block = _as_float_image(image[start:stop])
+            if channels == 4:
+                fg, alpha = block[..., :3], block[..., 3:4]
+            else:
+                fg, alpha = block[..., :1].expand(-1, -1, -1, 3), block[..., 1:2]
+
+            if bg_image is not None:
+                # Kürzere Hintergrund-Batches wiederholen ihre Frames
+                idx = torch.arange(start, stop) % bg_image.shape[0]
+                bg = self._to_rgb3(_as_float_image(bg_image[idx]).to(image.device))
+            else:
+                bg = bg_color.expand(stop - start, height, width, 3)
+
+            target = out[start:stop]
+            if alpha_mode == "composite_premultiplied":
+                torch.addcmul(fg, bg, 1.0 - alpha, out=target)
+            else:
+                torch.addcmul(bg, alpha, fg - bg, out=target)
+            del block, fg, alpha, bg
+        return out
+
+    @staticmethod
+    def _to_rgb3(frames):
+        """Hintergrundbild auf 3 Kanäle bringen (Alpha wird ignoriert, Graustufen expandiert)."""
+        if frames.shape[-1] >= 3:
+            return frames[..., :3]
+        return frames[..., :1].expand(*frames.shape[:-1], 3)
+
 
 class SaveImageWithSidecarTxt_V2:
     def __init__(self):
         self.output_dir = folder_paths.get_output_directory()
         self.type = "output"
-        self.compress_level = 4
 
     @classmethod
     def INPUT_TYPES(s):
@@ -129,6 +285,61 @@ class SaveImageWithSidecarTxt_V2:
                         "placeholder": "C:\\Mein\\Pfad (optional)",
                     },
                 ),
+                "encoder_profile": (
+                    list(ENCODER_PROFILES),
+                    {
+                        "default": "balanced",
+                        "tooltip": "Encoder speed/size trade-off, see the Encoder Profile Benchmark node",
+                    },
+                ),
+                "sidecar_mode": (
+                    SIDECAR_MODES,
+                    {
+                        "default": "txt_file",
+                        "tooltip": "embedded: write the sidecar text into the image (PNG iTXt / EXIF UserComment) instead of a separate .txt file",
+                    },
+                ),
+                "async_save": (
+                    "BOOLEAN",
+                    {
+                        "default": False,
+                        "tooltip": "Encode and write files in background threads and return immediately",
+                    },
+                ),
+                "encoder_workers": (
+                    "INT",
+                    {
+                        "default": 4,
+                        "min": 1,
+                        "max": 32,
+                        "step": 1,
+                        "tooltip": "Number of encoder threads used when async_save is enabled",
+                    },
+                ),
+                "metadata_mode": (
+                    ["embedded", "deduplicated"],
+                    {
+                        "default": "embedded",
+                        "tooltip": "deduplicated: store the workflow once per execution in .metadata/<hash>.json and embed only the hash reference (PNG)",
+                    },
+                ),
+                "shard_layout": (
+                    SHARD_LAYOUTS,
+                    {
+                        "default": "none",
+                        "tooltip": "Distribute files over subfolders: by date, by counter bucket or by filename hash prefix",
+                    },
+                ),
+                "shard_size": (
+                    "INT",
+                    {
+                        "default": 1000,
+                        "min": 1,
+                        "max": 1000000,
+                        "step": 1,
+                        "tooltip": "Files per subfolder for shard_layout = counter_bucket",
+                    },
+                ),
                 "positive_prompt": (
                     "STRING",
                     {"forceInput": True, "multiline": True, "default": ""},
@@ -176,6 +387,13 @@ class SaveImageWithSidecarTxt_V2:
         filename_prefix="ComfyUI",
         file_format="PNG",
         output_path="",
+        encoder_profile="balanced",
+        sidecar_mode="txt_file",
+        async_save=False,
+        encoder_workers=4,
+        metadata_mode="embedded",
+        shard_layout="none",
+        shard_size=1000,
         positive_prompt="",
         negative_prompt="",
         model_name="Unknown Model",
@@ -198,6 +416,119 @@ class SaveImageWithSidecarTxt_V2:
     ):
 
         # 1. Pfad-Logik (identisch zu V1)
+        base_output_dir = self._resolve_base_output_dir(output_path)
+
+        full_output_folder, filename, subfolder, filename_prefix = resolve_save_prefix(
+            filename_prefix, base_output_dir, images.shape[2], images.shape[1]
+        )
+
+        extension = file_format.lower()
+        if extension == "jpeg":
+            extension = "jpg"
+
+        # Sharding: Unterordner je Datei (Datum / Zähler-Bucket / Hash-Präfix).
+        # Das Datum wird einmal pro Ausführung bestimmt, damit ein Batch zusammenbleibt.
+        shard_date = time.strftime("%Y-%m-%d")
+
+        def shard_for(c):
+            return shard_subfolder(
+                shard_layout, c, f"{filename}_{c:05}_", shard_size, shard_date
+            )
+
+        # Zähler aus dem persistenten Index reservieren statt den Ordner bei jedem
+        # Speichern komplett zu scannen. Reserviert wird sofort für den ganzen Batch,
+        # damit noch wartende Write-Behind-Dateien nicht überschrieben werden.
+        def counter_taken(c):
+            file_base = os.path.join(full_output_folder, shard_for(c), f"{filename}_{c:05}_")
+            return os.path.exists(f"{file_base}.{extension}") or os.path.exists(f"{file_base}.txt")
+
+        counter = COUNTER_INDEX.reserve(
+            full_output_folder,
+            f"image:{filename}",
+            len(images),
+            seed=lambda: scan_save_counter(
+                full_output_folder, filename, include_subfolders=shard_layout != "none"
+            ),
+            is_taken=counter_taken,
+        )
+
+        # 2. Sampler String Konstruktion (Das Herzstück von V2)
+        formatted_sampler_details = self._format_sampler_details(
+            p1_sampler, p1_scheduler, p1_steps, p1_seed,
+            p2_sampler, p2_scheduler, p2_steps, p2_seed,
+            p3_sampler, p3_scheduler, p3_steps, p3_seed,
+        )
+
+        if async_save:
+            # Queue mit Backpressure: max. 4 wartende Frames pro Encoder-Thread
+            SAVE_QUEUE.configure(encoder_workers, encoder_workers * 4)
+
+        # Gesamten Batch einmalig quantisieren und in einem Schritt auf die CPU holen
+        frames = _images_to_uint8(images)
+
+        # PNG-Metadaten einmal pro Ausführung serialisieren (nicht pro Bild)
+        metadata = None
+        if file_format == "PNG":
+            metadata = PngInfo()
+            if metadata_mode == "deduplicated":
+                if prompt is not None or extra_pnginfo is not None:
+                    ref = store_metadata(
+                        full_output_folder, serialize_metadata(prompt, extra_pnginfo)
+                    )
+                    metadata.add_text(METADATA_REF_KEY, ref)
+            else:
+                if prompt is not None:
+                    metadata.add_text("prompt", json.dumps(prompt))
+                if extra_pnginfo is not None:
+                    for x in extra_pnginfo:
+                        metadata.add_text(x, json.dumps(extra_pnginfo[x]))
+
+        results = list()
+        for frame in frames:
+
+            file_base = f"{filename}_{counter:05}_"
+            file_img = f"{file_base}.{extension}"
+            file_txt = f"{file_base}.txt"
+
+            shard = shard_for(counter)
+            image_folder = os.path.join(full_output_folder, shard)
+            if shard:
+                os.makedirs(image_folder, exist_ok=True)
+
+            image_path = os.path.join(image_folder, file_img)
+            txt_path = os.path.join(image_folder, file_txt)
+
+            # Text zusammenstellen
+            txt_content = self._build_sidecar_text(
+                file_img, image_path, file_format, model_name, clip_name, vae_name,
+                positive_prompt, negative_prompt, formatted_sampler_details,
+            )
+            if async_save:
+                # Write-behind: Encoding läuft im Hintergrund, die UI bekommt sofort ihr Ergebnis
+                SAVE_QUEUE.submit(
+                    self._write_image_and_sidecar,
+                    frame, file_format, image_path, metadata, txt_path, txt_content,
+                    encoder_profile, sidecar_mode,
+                )
+            else:
+                self._write_image_and_sidecar(
+                    frame, file_format, image_path, metadata, txt_path, txt_content,
+                    encoder_profile, sidecar_mode,
+                )
+
+            results.append(
+                {
+                    "filename": file_img,
+                    "subfolder": os.path.join(subfolder, shard) if shard else subfolder,
+                    "type": self.type,
+                }
+            )
+            counter += 1
+
+        return {"ui": {"images": results}}
+
+    def _resolve_base_output_dir(self, output_path):
+        """Eigener Ausgabeordner (wird bei Bedarf angelegt) oder ComfyUI-Output als Fallback."""
         if output_path and output_path.strip():
             base_output_dir = output_path.strip()
             try:
@@ -207,18 +538,15 @@ class SaveImageWithSidecarTxt_V2:
                 base_output_dir = self.output_dir
         else:
             base_output_dir = self.output_dir
+        return base_output_dir
 
-        full_output_folder, filename, counter, subfolder, filename_prefix = (
-            folder_paths.get_save_image_path(
-                filename_prefix, base_output_dir, images.shape[2], images.shape[1]
-            )
-        )
-
-        extension = file_format.lower()
-        if extension == "jpeg":
-            extension = "jpg"
-
-        # 2. Sampler String Konstruktion (Das Herzstück von V2)
+    def _format_sampler_details(
+        self,
+        p1_sampler=None, p1_scheduler=None, p1_steps=None, p1_seed=None,
+        p2_sampler=None, p2_scheduler=None, p2_steps=None, p2_seed=None,
+        p3_sampler=None, p3_scheduler=None, p3_steps=None, p3_seed=None,
+    ):
+        """Baut die Sampler-Zeilen (bis zu 3 Pässe) für die Sidecar-Metadaten."""
         sampler_lines = []
 
         # Pass 1
@@ -251,43 +579,14 @@ class SaveImageWithSidecarTxt_V2:
                 f"Third Sampler: --> {s_name}, Third Scheduler: --> {sched}, Steps third Sampler: --> {st}, Seed third Sampler: --> {sd}"
             )
 
-        formatted_sampler_details = "\n".join(sampler_lines)
-
-        results = list()
-        for image in images:
-            # Bild speichern (identisch zu V1)
-            i = 255.0 * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            if file_format in ["JPG", "JPEG"] and img.mode == "RGBA":
-                img = img.convert("RGB")
-
-            metadata = None
-            if file_format == "PNG":
-                metadata = PngInfo()
-                if prompt is not None:
-                    metadata.add_text("prompt", json.dumps(prompt))
-                if extra_pnginfo is not None:
-                    for x in extra_pnginfo:
-                        metadata.add_text(x, json.dumps(extra_pnginfo[x]))
+        return "\n".join(sampler_lines)
 
-            file_base = f"{filename}_{counter:05}_"
-            file_img = f"{file_base}.{extension}"
-            file_txt = f"{file_base}.txt"
-
-            image_path = os.path.join(full_output_folder, file_img)
-            txt_path = os.path.join(full_output_folder, file_txt)
-
-            if file_format == "PNG":
-                img.save(
-                    image_path, pnginfo=metadata, compress_level=self.compress_level
-                )
-            elif file_format in ["JPG", "JPEG"]:
-                img.save(image_path, quality=95)
-            elif file_format == "WEBP":
-                img.save(image_path, quality=95, lossless=False)
-
-            # Text speichern
-            txt_content = f"""FILENAME INFORMATION
+    def _build_sidecar_text(
+        self, file_img, image_path, file_format, model_name, clip_name, vae_name,
+        positive_prompt, negative_prompt, formatted_sampler_details,
+    ):
+        """Sidecar-Inhalt (TXT-Datei) für ein gespeichertes Bild."""
+        return f"""FILENAME INFORMATION
 Filename: {file_img}
 Filepath: {image_path}
 Format:   {file_format}
@@ -313,18 +612,235 @@ SAMPLING PROCESS (Seeds & Steps)
 ==================================================
 {formatted_sampler_details}
 """
-            try:
-                with open(txt_path, "w", encoding="utf-8") as f:
-                    f.write(txt_content)
-            except Exception as e:
-                print(f"Error: {e}")
 
-            results.append(
-                {"filename": file_img, "subfolder": subfolder, "type": self.type}
+    def _encode_image(
+        self, frame, file_format, target, metadata=None, profile="balanced", exif=None
+    ):
+        """Encodiert ein uint8-Frame nach `target` (Dateipfad oder Datei-Objekt)."""
+        img = Image.fromarray(frame)
+        if file_format in ["JPG", "JPEG"] and img.mode == "RGBA":
+            img = img.convert("RGB")
+
+        params = encoder_params(profile, file_format)
+        if exif is not None:
+            params["exif"] = exif
+        if file_format == "PNG":
+            img.save(target, format="PNG", pnginfo=metadata, **params)
+        elif file_format in ["JPG", "JPEG"]:
+            img.save(target, format="JPEG", **params)
+        elif file_format == "WEBP":
+            img.save(target, format="WEBP", **params)
+
+    def _write_image_and_sidecar(
+        self, frame, file_format, image_path, metadata, txt_path, txt_content,
+        profile="balanced", sidecar_mode="txt_file",
+    ):
+        """Encodiert ein uint8-Frame und schreibt Bild + Sidecar-TXT (synchron oder im Worker-Thread)."""
+        exif = None
+        if sidecar_mode in ("embedded", "both"):
+            # Sidecar-Text direkt ins Bild: PNG iTXt-Chunk bzw. EXIF UserComment
+            if file_format == "PNG":
+                image_metadata = PngInfo()
+                image_metadata.chunks = list(metadata.chunks) if metadata is not None else []
+                image_metadata.add_itxt(SIDECAR_PNG_KEY, txt_content)
+                metadata = image_metadata
+            else:
+                # JPEG: APP1-Segment max. 64 KB; zu lange Texte landen stattdessen in der .txt
+                max_bytes = JPEG_EXIF_MAX_BYTES if file_format in ["JPG", "JPEG"] else None
+                exif = build_sidecar_exif(txt_content, max_bytes)
+                if exif is None:
+                    print(
+                        f"Warnung: Sidecar-Text ({len(txt_content)} Zeichen) passt nicht in den "
+                        f"JPEG-EXIF-Block, schreibe stattdessen {os.path.basename(txt_path)}"
+                    )
+                    if sidecar_mode == "embedded":
+                        sidecar_mode = "txt_file"
+
+        self._encode_image(frame, file_format, image_path, metadata, profile, exif)
+
+        if sidecar_mode == "embedded":
+            return
+
+        # Text speichern
+        try:
+            with open(txt_path, "w", encoding="utf-8") as f:
+                f.write(txt_content)
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+class SaveImageToTarShards(SaveImageWithSidecarTxt_V2):
+    """
+    Schwester-Node zu SaveImageWithSidecarTxt_V2 für Trainingsdatensätze:
+    Statt Millionen einzelner Bild- und TXT-Dateien werden Bild, Sidecar-Text
+    und ein JSON-Metadatensatz pro Sample an rotierende WebDataset-Tar-Shards
+    angehängt (<prefix>-000000.tar, ...). Eine Index-Datei <prefix>.index.jsonl
+    enthält die Byte-Offsets aller Member, damit Leser ohne Entpacken seeken können.
+    """
+
+    @classmethod
+    def INPUT_TYPES(s):
+        base = SaveImageWithSidecarTxt_V2.INPUT_TYPES()
+        # Metadaten-Sockets (forceInput) identisch zu V2 übernehmen
+        metadata_inputs = {
+            k: v for k, v in base["optional"].items() if v[1].get("forceInput")
+        }
+        return {
+            "required": {
+                "images": ("IMAGE",),
+                "filename_prefix": ("STRING", {"default": "dataset"}),
+                "file_format": (["PNG", "JPG", "JPEG", "WEBP"], {"default": "PNG"}),
+            },
+            "optional": {
+                "output_path": base["optional"]["output_path"],
+                "encoder_profile": base["optional"]["encoder_profile"],
+                "shard_size_mb": (
+                    "INT",
+                    {
+                        "default": 1024,
+                        "min": 1,
+                        "max": 65536,
+                        "step": 1,
+                        "tooltip": "Maximum size of one .tar shard before a new one is started",
+                    },
+                ),
+                **metadata_inputs,
+            },
+            "hidden": base["hidden"],
+        }
+
+    FUNCTION = "save_to_tar_shards"
+
+    def save_to_tar_shards(
+        self,
+        images,
+        filename_prefix="dataset",
+        file_format="PNG",
+        output_path="",
+        encoder_profile="balanced",
+        shard_size_mb=1024,
+        positive_prompt="",
+        negative_prompt="",
+        model_name="Unknown Model",
+        clip_name="Unknown CLIP",
+        vae_name="Unknown VAE",
+        prompt=None,
+        extra_pnginfo=None,
+        **sampler_kwargs,
+    ):
+        base_output_dir = self._resolve_base_output_dir(output_path)
+        full_output_folder, filename, _, _ = resolve_save_prefix(
+            filename_prefix, base_output_dir, images.shape[2], images.shape[1]
+        )
+        writer = get_tar_shard_writer(
+            full_output_folder, filename, shard_size_mb * 1024 * 1024
+        )
+
+        extension = file_format.lower()
+        if extension == "jpeg":
+            extension = "jpg"
+
+        formatted_sampler_details = self._format_sampler_details(**sampler_kwargs)
+
+        # Workflow einmal pro Ausführung im Metadaten-Store ablegen, Samples referenzieren ihn nur
+        metadata_ref = None
+        if prompt is not None or extra_pnginfo is not None:
+            metadata_ref = store_metadata(
+                full_output_folder, serialize_metadata(prompt, extra_pnginfo)
             )
-            counter += 1
 
-        return {"ui": {"images": results}}
+        frames = _images_to_uint8(images)
+        records = []
+        for frame in frames:
+            key = writer.next_key()
+            file_img = f"{key}.{extension}"
+
+            buffer = io.BytesIO()
+            self._encode_image(frame, file_format, buffer, profile=encoder_profile)
+
+            record = {
+                "filename": file_img,
+                "format": file_format,
+                "width": int(frame.shape[1]),
+                "height": int(frame.shape[0]),
+                "diffusion_model": model_name,
+                "clip_model": clip_name,
+                "vae_model": vae_name,
+                "positive_prompt": positive_prompt,
+                "negative_prompt": negative_prompt,
+                "sampling": formatted_sampler_details.splitlines(),
+                "metadata_ref": metadata_ref,
+            }
+
+            def build_members(shard_name, file_img=file_img, image_bytes=buffer.getvalue(), record=record):
+                # Sidecar-Text erst nach der Shard-Wahl: Filepath = <Shard>.tar/<Member>
+                txt_content = self._build_sidecar_text(
+                    file_img, os.path.join(full_output_folder, shard_name, file_img), file_format,
+                    model_name, clip_name, vae_name,
+                    positive_prompt, negative_prompt, formatted_sampler_details,
+                )
+                return {
+                    extension: image_bytes,
+                    "txt": txt_content.encode("utf-8"),
+                    "json": json.dumps(record, ensure_ascii=False).encode("utf-8"),
+                }
+
+            records.append(writer.write_sample(build_members, key=key))
+
+        print(f" Appended {len(records)} samples to {writer.current_shard_path}")
+        return {}
+
+
+class EncoderProfileBenchmark:
+    """
+    Misst für jedes Encoder-Profil der Save-Nodes Durchsatz (MB/s Rohpixel) und
+    Bytes pro Bild auf einem Beispiel-Batch – Encoding nur im Speicher, es wird
+    nichts geschrieben. Grundlage, um das Profil anhand von Daten zu wählen.
+    """
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "images": ("IMAGE",),
+                "formats": (["all", "PNG", "JPEG", "WEBP"], {"default": "all"}),
+                "repeats": ("INT", {"default": 1, "min": 1, "max": 20, "step": 1}),
+            },
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("report",)
+    FUNCTION = "benchmark"
+    OUTPUT_NODE = True
+    CATEGORY = "Custom_Research/IO"
+
+    def benchmark(self, images, formats="all", repeats=1):
+        frames = _images_to_uint8(images)
+        selected = ("PNG", "JPEG", "WEBP") if formats == "all" else (formats,)
+        rows = benchmark_encoder_profiles(list(frames), selected, repeats=repeats)
+        report = (
+            f"{len(frames)} x {frames.shape[2]}x{frames.shape[1]} px, {repeats} repeat(s)\n"
+            + format_benchmark_table(rows)
+        )
+        print(report)
+        return {"ui": {"text": [report]}, "result": (report,)}
+
+
+def _pyramid_reduce(samples, width, height):
+    """
+    Halves a [B,C,H,W] batch with 2x2 box filters until it is less than twice
+    the target size in either dimension (an odd last row/column is dropped).
+    Box averaging is an exact area filter for a factor of two; summing the four
+    strided phases works on any memory layout and costs one pass per step.
+    """
+    while samples.shape[-2] >= 2 * height and samples.shape[-1] >= 2 * width:
+        h = samples.shape[-2] // 2 * 2
+        w = samples.shape[-1] // 2 * 2
+        samples = (
+            samples[..., 0:h:2, 0:w:2] + samples[..., 1:h:2, 0:w:2]
+            + samples[..., 0:h:2, 1:w:2] + samples[..., 1:h:2, 1:w:2]
+        ).mul_(0.25)
+    return samples
 
 
 class MegapixelResizeNode:
@@ -358,9 +874,21 @@ class MegapixelResizeNode:
                 }),
                 
                 # Resampling method selection
-                "method": (["lanczos", "bicubic", "bilinear", "nearest-exact", "area"], {
+                # area-pyramid: fast path for large reductions (2x box steps + final lanczos)
+                "method": (["lanczos", "bicubic", "bilinear", "nearest-exact", "area", "area-pyramid"], {
                     "default": "lanczos"
                 }),
+            },
+            "optional": {
+                # Upper bound for the resize working set; larger batches are
+                # processed in sub-batches (0 = whole batch at once)
+                "memory_budget_mb": ("INT", {
+                    "default": 2048,
+                    "min": 0,
+                    "max": 1048576,
+                    "step": 64,
+                    "tooltip": "Approximate memory budget for resizing; larger batches are split into sub-batches"
+                }),
             }
         }
 
@@ -370,12 +898,66 @@ class MegapixelResizeNode:
     FUNCTION = "resize"
     CATEGORY = "Image/Resizing"
 
-    def resize(self, image, target_megapixels, method):
+    # The node receives whole lists (e.g. the mixed-resolution output of
+    # DirectoryImageIterator) and returns one entry per input item, so
+    # single-batch workflows behave exactly as before.
+    INPUT_IS_LIST = True
+    OUTPUT_IS_LIST = (True, True, True)
+
+    def resize(self, image, target_megapixels, method, memory_budget_mb=None):
+        """
+        Resizes every item of the input list to its own target size. Items with
+        identical source dimensions and settings are resized together in
+        batched, memory-budgeted chunks; the results are returned in the
+        original order.
+        """
+        count = len(image)
+
+        def item_value(values, i, default=None):
+            # Widget values arrive as single-element lists; linked lists are broadcast
+            if values is None or len(values) == 0:
+                return default
+            return values[i] if len(values) > 1 else values[0]
+
+        groups = {}
+        for i, img in enumerate(image):
+            # Compact uint8/float16 input (DirectoryImageIterator) stays compact
+            # here; it is expanded to float chunk by chunk in _resize_batch
+            settings = (
+                item_value(target_megapixels, i),
+                item_value(method, i),
+                item_value(memory_budget_mb, i, 2048),
+            )
+            key = (tuple(img.shape[1:]), img.dtype, img.device, settings)
+            groups.setdefault(key, []).append((i, img))
+
+        out_images = [None] * count
+        out_widths = [0] * count
+        out_heights = [0] * count
+        for (_, _, _, settings), members in groups.items():
+            result, new_w, new_h = self._resize_batch([img for _, img in members], *settings)
+            offset = 0
+            for i, img in members:
+                out_images[i] = result[offset:offset + img.shape[0]]
+                out_widths[i] = new_w
+                out_heights[i] = new_h
+                offset += img.shape[0]
+
+        return (out_images, out_widths, out_heights)
+
+    def _resize_batch(self, image, target_megapixels, method, memory_budget_mb=2048):
+        """
+        Resizes one [B,H,W,C] batch, or a list of batches with identical frame
+        size, to the target megapixel count. Returns a single batch with all
+        frames in order.
+        """
+        parts = list(image) if isinstance(image, (list, tuple)) else [image]
+
         # 1. Analyze Input Dimensions
         # ComfyUI images are
         # We perform the calculation based on the first image in the batch,
         # assuming all images in a batch share dimensions (standard Comfy behavior).
-        _, current_h, current_w, _ = image.shape
+        _, current_h, current_w, _ = parts[0].shape
         
         # 2. Calculate Aspect Ratio
         aspect_ratio = current_w / current_h
@@ -397,28 +979,203 @@ class MegapixelResizeNode:
         new_w = max(new_w, 8)
         new_h = max(new_h, 8)
         
-        # 5. Prepare Tensor for Resizing
-        # comfy.utils.common_upscale expects
-        # Input is, so we move dimensions.
+        # 5. Split the batch into sub-batches that fit the memory budget.
+        # Working set per frame (approx.): source + target in float32, twice
+        # for the intermediate copies the resamplers make.
+        batch_size = sum(part.shape[0] for part in parts)
+        channels = parts[0].shape[-1]
+        frame_bytes = 2 * (current_h * current_w + new_h * new_w) * channels * 4
+        if memory_budget_mb > 0:
+            chunk_size = max(1, int(memory_budget_mb * 1024 * 1024 // frame_bytes))
+        else:
+            chunk_size = batch_size
+
+        if chunk_size >= batch_size and len(parts) == 1:
+            return (self._resize_chunk(_as_float_image(parts[0]), new_w, new_h, method), new_w, new_h)
+
+        # 6. Chunked path: every sub-batch is written into one preallocated output.
+        # All methods resample each frame independently, so the result is
+        # identical to the one-shot path. Compact (uint8/float16) input is
+        # expanded to float one chunk at a time, and list items are only
+        # concatenated up to the chunk size, never as a whole.
+        result_image = None
+        written = 0
+        for pieces in self._iter_chunks(parts, chunk_size):
+            chunk = pieces[0] if len(pieces) == 1 else torch.cat([_as_float_image(p) for p in pieces])
+            part = self._resize_chunk(_as_float_image(chunk), new_w, new_h, method)
+            del chunk
+            if result_image is None:
+                if part.shape[0] == batch_size:
+                    return (part, new_w, new_h)
+                result_image = torch.empty(
+                    (batch_size, new_h, new_w, part.shape[-1]), dtype=part.dtype, device=part.device
+                )
+            result_image[written:written + part.shape[0]].copy_(part)
+            written += part.shape[0]
+            del part
+
+        # 7. Return results
+        return (result_image, new_w, new_h)
+
+    @staticmethod
+    def _iter_chunks(parts, chunk_size):
+        """Yields lists of frame slices from `parts` with at most chunk_size frames in total."""
+        pieces = []
+        count = 0
+        for part in parts:
+            start = 0
+            while start < part.shape[0]:
+                take = min(chunk_size - count, part.shape[0] - start)
+                pieces.append(part[start:start + take])
+                count += take
+                start += take
+                if count == chunk_size:
+                    yield pieces
+                    pieces = []
+                    count = 0
+        if pieces:
+            yield pieces
+
+    @staticmethod
+    def _resize_chunk(image, new_w, new_h, method):
+        """Resizes a [B,H,W,C] (sub-)batch with comfy.utils.common_upscale."""
+        # comfy.utils.common_upscale expects [B,C,H,W], so we move dimensions.
         image_moved = image.movedim(-1, 1)
-        
-        # 6. Execute Resizing
+
+        if method == "area-pyramid":
+            # Cheap 2x box reductions first, so lanczos only runs on an image
+            # that is less than twice the target size
+            image_moved = _pyramid_reduce(image_moved, new_w, new_h)
+            method = "lanczos"
+
         # We use comfy.utils.common_upscale as it handles the "method" string mapping
         # and internal device management better than raw torch.nn.functional
         resized_image_moved = comfy.utils.common_upscale(
-            image_moved, 
-            new_w, 
-            new_h, 
-            method, 
+            image_moved,
+            new_w,
+            new_h,
+            method,
             crop="disabled" # We do not want to crop, we want to scale
         )
-        
-        # 7. Restore Tensor Layout
-        # Convert back to for ComfyUI
-        result_image = resized_image_moved.movedim(1, -1)
-        
-        # 8. Return results
-        return (result_image, new_w, new_h)
+
+        # Convert back to [B,H,W,C] for ComfyUI
+        return resized_image_moved.movedim(1, -1)
+
+
+def _iterator_target_size(src_w, src_h, max_pixels):
+    """Decode-time target size (stored orientation) for max_pixels, or None for full size."""
+    if max_pixels <= 0 or src_w * src_h <= max_pixels:
+        return None
+    scale = math.sqrt(max_pixels / (src_w * src_h))
+    return (max(1, int(src_w * scale)), max(1, int(src_h * scale)))
+
+
+def _probe_iterator_image_size(img_path, max_pixels=0):
+    """
+    Output (width, height) of _decode_iterator_image() from the file header
+    alone (EXIF orientation and max_pixels applied), without decoding pixels.
+    """
+    with Image.open(img_path) as img:
+        width, height = img.size
+        orientation = img.getexif().get(0x0112, 1)
+    target = _iterator_target_size(width, height, max_pixels)
+    if target is not None:
+        width, height = target
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    return width, height
+
+
+def _write_iterator_thumbnail(img, thumb_path):
+    """Writes the 512px JPEG preview of a PIL image for the iterator canvas widget."""
+    thumb = img.copy()
+    thumb.thumbnail((512, 512), Image.Resampling.LANCZOS)
+    # Write under a temporary name first, so the preview never serves a partial file
+    tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+    thumb.save(tmp_path, format="JPEG")
+    os.replace(tmp_path, thumb_path)
+
+
+def _decode_iterator_image(img_path, thumb_path, max_pixels=0):
+    """
+    Decodes one DirectoryImageIterator source file (EXIF-transposed RGB) and,
+    unless thumb_path is None (cache hit), writes its preview thumbnail. Runs
+    inside the decoder pool, so it must stay a picklable module-level function;
+    returns a uint8 [H,W,3] numpy array.
+
+    With max_pixels > 0, larger images are downscaled while decoding: JPEGs are
+    decoded at a reduced DCT scale (draft mode), the rest is shrunk with
+    Image.reduce() and a final LANCZOS pass hits the exact target size.
+    """
+    img = Image.open(img_path)
+
+    src_w, src_h = img.size
+    target = _iterator_target_size(src_w, src_h, max_pixels)
+    if target is not None:
+        # Draft keeps the image at least as large as requested
+        img.draft(img.mode, target)
+
+    img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    if target is not None:
+        # EXIF orientations 5-8 swap width and height
+        if (img.width > img.height) != (src_w > src_h) and src_w != src_h:
+            target = (target[1], target[0])
+        if img.size != target:
+            img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    if thumb_path is not None:
+        _write_iterator_thumbnail(img, thumb_path)
+    return np.asarray(img)
+
+
+def _ordered_prefetch(fn, jobs, workers, pool="thread", window=None):
+    """
+    Runs fn(*job) for every job on a thread or process pool and yields the
+    results in submission order. At most `window` jobs are in flight, which
+    bounds the number of decoded-but-unconsumed images held in memory.
+    With workers <= 1 everything runs inline on the calling thread.
+    """
+    jobs = list(jobs)
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield fn(*job)
+        return
+
+    window = max(window or workers * 2, workers)
+    use_processes = pool == "process"
+    if use_processes and "fork" not in multiprocessing.get_all_start_methods():
+        # Processes need "fork" (the node module is not importable from a
+        # spawned interpreter), which Windows does not have
+        print("Warning: decode_pool 'process' needs the 'fork' start method, "
+              "which is not available on this platform; using threads instead.")
+        use_processes = False
+    if use_processes:
+        # Note: this forks the whole ComfyUI server process (CUDA context,
+        # server threads). The children only decode images, but a fork of a
+        # multi-threaded process can deadlock on locks held at fork time.
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork")
+        )
+    else:
+        # PIL releases the GIL while decoding, so threads scale as well
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    with executor:
+        pending = deque()
+        job_iter = iter(jobs)
+        for job in job_iter:
+            pending.append(executor.submit(fn, *job))
+            if len(pending) >= window:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for job in job_iter:
+                pending.append(executor.submit(fn, *job))
+                break
+            yield result
 
 
 class DirectoryImageIterator:
@@ -439,90 +1196,462 @@ class DirectoryImageIterator:
                 "start_index": ("INT", {"default": 0, "min": 0, "max": 100000, "step": 1}),
                 "image_limit": ("INT", {"default": 0, "min": 0, "max": 100000, "step": 1}),
             },
+            "optional": {
+                "decode_workers": ("INT", {
+                    "default": 0, "min": 0, "max": 64, "step": 1,
+                    "tooltip": "Parallel decoders; 0 = automatic (CPU count, max. 8), 1 = sequential"
+                }),
+                "decode_pool": (["thread", "process"], {
+                    "default": "thread",
+                    "tooltip": "Worker type for parallel decoding. thread is recommended: PIL decodes "
+                               "without the GIL. process forks the ComfyUI server process (CUDA state, "
+                               "threads), which can hang; it needs fork and falls back to threads "
+                               "with a warning elsewhere (e.g. Windows)"
+                }),
+                "thumbnail_cache_mb": ("INT", {
+                    "default": 256, "min": 16, "max": 16384, "step": 16,
+                    "tooltip": "Size limit of the preview thumbnail cache in the temp directory"
+                }),
+                "window_size": ("INT", {
+                    "default": 0, "min": 0, "max": 100000, "step": 1,
+                    "tooltip": "Streaming mode: emit only this many images per execution and advance "
+                               "an internal cursor through the slice on each queue; 0 = whole slice at once"
+                }),
+                "max_megapixels": ("FLOAT", {
+                    "default": 0.0, "min": 0.0, "max": 1000.0, "step": 0.01,
+                    "tooltip": "Downscale larger images while decoding (JPEG draft + reduce); 0 = full resolution"
+                }),
+                "output_dtype": (["float32", "float16", "uint8"], {
+                    "default": "float32",
+                    "tooltip": "float16/uint8 halve or quarter the memory; only for nodes that accept compact images"
+                }),
+                "bucket_mode": (cls.BUCKET_MODES, {
+                    "default": "off",
+                    "tooltip": "Group the slice into [N,H,W,C] batches: by exact size, or snapped to "
+                               "bucket_grid with zero padding (grid_pad) or center crop (grid_crop)"
+                }),
+                "bucket_grid": ("INT", {
+                    "default": 64, "min": 8, "max": 1024, "step": 8,
+                    "tooltip": "Bucket grid in pixels for grid_pad / grid_crop"
+                }),
+                "source": (["files", "pack"], {
+                    "default": "files",
+                    "tooltip": "pack: decode each image once into a memory-mapped pack in the cache "
+                               "directory and load it from there on later runs (no decode, no copy)"
+                }),
+                "incremental": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "Hot-folder mode: emit only files that are new or changed since the last "
+                               "run (image_limit = max. files per run, window_size is ignored)"
+                }),
+                "incremental_hash": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "Compare file contents (SHA-1) so touched but unchanged files are skipped"
+                }),
+                "manifest_name": ("STRING", {
+                    "default": "default",
+                    "tooltip": "Separate processed-files manifests for several workflows on the same folder"
+                }),
+                "preview_rate_hz": ("FLOAT", {
+                    "default": 10.0, "min": 0.0, "max": 60.0, "step": 0.5,
+                    "tooltip": "Max. live preview messages per second (several thumbnails each); "
+                               "0 = preview only after loading"
+                }),
+            },
             "hidden": {
                 "unique_id": "UNIQUE_ID"
             }
         }
 
-    RETURN_TYPES = ("IMAGE", "STRING")
-    RETURN_NAMES = ("image", "filename")
-    OUTPUT_IS_LIST = (True, True)
+    RETURN_TYPES = ("IMAGE", "STRING", "STRING")
+    RETURN_NAMES = ("image", "filename", "bucket_map")
+    OUTPUT_IS_LIST = (True, True, True)
     FUNCTION = "load_images"
     CATEGORY = "image/iteration"
 
+    BUCKET_MODES = ["off", "exact", "grid_pad", "grid_crop"]
+
+    # Cached per-folder listing (names, sizes, mtimes), see iterator_utils.py
+    _dir_index = DirectoryIndex(VALID_EXTENSIONS)
+    # Preview thumbnails keyed by path/size/mtime, shared across runs
+    _thumb_cache = ThumbnailCache()
+    # Streaming mode: node id -> (slice key, offset of the next window)
+    _window_cursors = {}
+    # Open image packs: (folder, max_pixels) -> ImagePack
+    _packs = {}
+    # Hot-folder manifests: (folder, manifest_name) -> ProcessedManifest
+    _manifests = {}
+
+    @staticmethod
+    def _cache_dir():
+        """Directory for persistent iterator caches (directory index, ...)."""
+        try:
+            return os.path.join(folder_paths.get_user_directory(), CACHE_DIRNAME)
+        except Exception:
+            return None
+
     @classmethod
     def _get_target_files(cls, folder_path, start_index, image_limit):
         """Returns the deterministically sorted slice of valid image filenames."""
-        files = sorted(
-            f for f in os.listdir(folder_path)
-            if f.lower().endswith(cls.VALID_EXTENSIONS)
-        )
-        end_idx = start_index + image_limit if image_limit > 0 else len(files)
-        return files[start_index:end_idx]
+        return cls._dir_index.slice(folder_path, start_index, image_limit, cls._cache_dir())
+
+    @classmethod
+    def _window_offset(cls, unique_id, folder_path, start_index, image_limit, window_size, total):
+        """Offset of the next window in streaming mode; restarts when the slice settings change."""
+        slice_key = (folder_path, start_index, image_limit, window_size)
+        cursor = cls._window_cursors.get(str(unique_id))
+        if cursor is None or cursor[0] != slice_key or cursor[1] >= total:
+            return 0
+        return cursor[1]
+
+    @staticmethod
+    def _current_prompt_id():
+        """Id of the prompt that is executing right now (None outside the ComfyUI server)."""
+        if PromptServer is None:
+            return None
+        return getattr(getattr(PromptServer, "instance", None), "last_prompt_id", None)
+
+    @staticmethod
+    def _prompt_status(prompt_id):
+        """'success' / 'error' of a finished prompt from ComfyUI's history, None if unknown."""
+        if prompt_id is None or PromptServer is None:
+            return None
+        try:
+            history = PromptServer.instance.prompt_queue.get_history(prompt_id=prompt_id)
+            return history[prompt_id]["status"]["status_str"]
+        except Exception:
+            return None
 
     @classmethod
-    def IS_CHANGED(cls, folder_path, start_index, image_limit, **kwargs):
+    def _resolve_staged(cls, manifest, executing):
+        """
+        Commits the files emitted by the previous run once it is known to have
+        succeeded, so a failing downstream node (save, VAE, ...) never loses
+        files. A failed run drops the staging and its files are emitted again.
+        Without a usable history entry, the next execution counts as success.
+        Only called while executing; IS_CHANGED makes sure that happens by
+        hashing the staging state.
+        """
+        if not manifest.has_staged:
+            return
+        token = manifest.staged_token
+        status = cls._prompt_status(token)
+        if status == "success":
+            manifest.commit_staged()
+        elif status == "error":
+            manifest.discard_staged()
+        elif executing and token != cls._current_prompt_id():
+            manifest.commit_staged()
+
+    @classmethod
+    def _incremental_files(cls, folder_path, start_index, image_limit, manifest_name, use_hash,
+                           executing=False):
+        """
+        Hot-folder mode: the slice of files that are new or changed according to
+        the on-disk manifest. Needs one stat per file of the folder.
+        """
+        cache_dir = cls._cache_dir()
+        if cache_dir is None:
+            raise ValueError("Incremental mode needs the ComfyUI user directory for its manifest.")
+        manifest_key = (folder_path, manifest_name)
+        manifest = cls._manifests.get(manifest_key)
+        if manifest is None:
+            manifest = cls._manifests[manifest_key] = ProcessedManifest(cache_dir, folder_path, manifest_name)
+        if executing:
+            cls._resolve_staged(manifest, executing)
+
+        names = cls._dir_index.list_files(folder_path, cache_dir)
+        stats = cls._dir_index.stat_files(folder_path, names, cache_dir)
+        pending = manifest.select(names, stats, use_hash)
+        end_idx = start_index + image_limit if image_limit > 0 else len(pending)
+        return manifest, pending[start_index:end_idx]
+
+    @classmethod
+    def IS_CHANGED(cls, folder_path, start_index, image_limit, window_size=0, incremental=False,
+                   incremental_hash=False, manifest_name="default", unique_id=None, **kwargs):
         """Cryptographic hash of the target slice — re-executes only on real changes."""
         folder_path = os.path.realpath(os.path.abspath(folder_path))
         if not os.path.isdir(folder_path):
             return float("NaN")
 
+        staged_marker = None
+        if incremental:
+            # Re-executes whenever the set of pending (new/changed) files changes
+            manifest, target_files = cls._incremental_files(
+                folder_path, start_index, image_limit, manifest_name, incremental_hash
+            )
+            window_size = 0
+            if manifest.has_staged:
+                # The previous run's files still await their commit or retry:
+                # always re-execute, so load_images resolves and re-stages them
+                # instead of downstream nodes reusing a cached, uncommitted output
+                if manifest.staged_token is None:
+                    return float("NaN")
+                staged_marker = f"staged:{manifest.staged_token}"
+        else:
+            # One stat for the directory plus one per file in the slice
+            target_files = cls._get_target_files(folder_path, start_index, image_limit)
+        if window_size > 0:
+            # Streaming mode: only the current window counts, and every queue
+            # moves on to the next window
+            offset = cls._window_offset(
+                unique_id, folder_path, start_index, image_limit, window_size, len(target_files)
+            )
+            target_files = target_files[offset:offset + window_size]
+        stats = cls._dir_index.stat_files(folder_path, target_files, cls._cache_dir())
         m = hashlib.sha256()
-        for filename in cls._get_target_files(folder_path, start_index, image_limit):
-            file_path = os.path.join(folder_path, filename)
-            m.update(filename.encode('utf-8'))
-            m.update(str(os.path.getmtime(file_path)).encode('utf-8'))
+        if window_size > 0:
+            m.update(f"window:{offset}".encode('utf-8'))
+        if staged_marker is not None:
+            m.update(staged_marker.encode('utf-8'))
+        for filename, (size, mtime_ns) in zip(target_files, stats):
+            m.update(filename.encode('utf-8', 'surrogateescape'))
+            m.update(f"{size}:{mtime_ns}".encode('utf-8'))
         return m.hexdigest()
 
-    def load_images(self, folder_path, start_index, image_limit, unique_id=None):
+    @staticmethod
+    def _to_output_tensor(img_array, output_dtype):
+        """uint8 [H,W,3] array -> [H,W,3] tensor in the requested output dtype."""
+        if output_dtype == "uint8":
+            # Compact output, converted to float only by the consuming node
+            if not img_array.flags.writeable:
+                img_array = img_array.copy()
+            return torch.from_numpy(img_array)
+        # astype() yields a fresh, writable array (np.asarray of a PIL image is
+        # read-only), so torch.from_numpy neither copies nor warns
+        img_tensor = torch.from_numpy(img_array.astype(np.float32)).div_(255.0)
+        if output_dtype == "float16":
+            img_tensor = img_tensor.to(torch.float16)
+        return img_tensor
+
+    @staticmethod
+    def _plan_buckets(sizes, bucket_mode, bucket_grid):
+        """
+        Groups image sizes into buckets. Returns the bucket sizes (in order of
+        first appearance) and, per image, (bucket index, row in the bucket).
+        """
+        bucket_index = {}
+        bucket_sizes = []
+        bucket_rows = []
+        placement = []
+        for width, height in sizes:
+            if bucket_mode == "grid_pad":
+                key = (-(-width // bucket_grid) * bucket_grid, -(-height // bucket_grid) * bucket_grid)
+            elif bucket_mode == "grid_crop":
+                key = (max(bucket_grid, width // bucket_grid * bucket_grid),
+                       max(bucket_grid, height // bucket_grid * bucket_grid))
+            else:
+                key = (width, height)
+            if key not in bucket_index:
+                bucket_index[key] = len(bucket_sizes)
+                bucket_sizes.append(key)
+                bucket_rows.append(0)
+            b = bucket_index[key]
+            placement.append((b, bucket_rows[b]))
+            bucket_rows[b] += 1
+        return bucket_sizes, bucket_rows, placement
+
+    @staticmethod
+    def _place_in_bucket(slot, img_tensor):
+        """Copies an [h,w,C] image into a bucket row: centered crop if larger, zero padding (bottom/right) if smaller."""
+        h, w = img_tensor.shape[:2]
+        ch, cw = min(h, slot.shape[0]), min(w, slot.shape[1])
+        top, left = (h - ch) // 2, (w - cw) // 2
+        slot[:ch, :cw].copy_(img_tensor[top:top + ch, left:left + cw])
+
+    def _load_from_pack(self, folder_path, target_files, stats, jobs, max_pixels, workers, decode_pool):
+        """
+        Yields the uint8 arrays of the slice from the folder's image pack. Images
+        that are missing or stale (size/mtime changed) are decoded on the worker
+        pool and appended to the pack; packed ones are memmap views.
+        """
+        cache_dir = self._cache_dir()
+        if cache_dir is None:
+            yield from _ordered_prefetch(_decode_iterator_image, jobs, workers, decode_pool)
+            return
+
+        pack_key = (folder_path, max_pixels)
+        pack = self._packs.get(pack_key)
+        if pack is None:
+            pack = self._packs[pack_key] = ImagePack(cache_dir, folder_path, max_pixels)
+        # Files deleted from the folder must not stay live in the pack forever
+        pruned = pack.prune(self._dir_index.list_files(folder_path, cache_dir))
+
+        entries = [pack.lookup(name, *stat) for name, stat in zip(target_files, stats)]
+        missing = [job for job, entry in zip(jobs, entries) if entry is None]
+        decoded = _ordered_prefetch(_decode_iterator_image, missing, workers, decode_pool)
+
+        try:
+            for name, stat, job, entry in zip(target_files, stats, jobs, entries):
+                if entry is None:
+                    img_array = next(decoded)
+                    pack.append([(name, stat[0], stat[1], img_array)])
+                    yield img_array
+                else:
+                    img_array = pack.read(pack.lookup(name, *stat))
+                    if job[1] is not None:
+                        _write_iterator_thumbnail(Image.fromarray(img_array), job[1])
+                    yield img_array
+        finally:
+            if missing or pruned:
+                pack.flush()
+
+    def load_images(self, folder_path, start_index, image_limit, decode_workers=0,
+                    decode_pool="thread", thumbnail_cache_mb=256, window_size=0,
+                    max_megapixels=0.0, output_dtype="float32", bucket_mode="off",
+                    bucket_grid=64, source="files", incremental=False, incremental_hash=False,
+                    manifest_name="default", preview_rate_hz=10.0, unique_id=None):
         # Resolve to absolute path to prevent path traversal
         folder_path = os.path.realpath(os.path.abspath(folder_path))
         if not os.path.isdir(folder_path):
             raise ValueError(f"Directory does not exist: {folder_path}")
 
-        target_files = self._get_target_files(folder_path, start_index, image_limit)
-        if not target_files:
-            raise ValueError("No valid images found in the specified range.")
+        manifest = None
+        if incremental:
+            # Hot-folder mode: only new or changed files, nothing to do is not an error
+            manifest, target_files = self._incremental_files(
+                folder_path, start_index, image_limit, manifest_name, incremental_hash, executing=True
+            )
+            if not target_files:
+                # Empty lists cannot be mapped by downstream nodes: block them instead
+                print(f"DirectoryImageIterator: no new files in {folder_path}")
+                blocker = ExecutionBlocker(None)
+                return {"ui": {"images": []}, "result": ([blocker], [blocker], [blocker])}
+            window_size = 0
+        else:
+            target_files = self._get_target_files(folder_path, start_index, image_limit)
+            if not target_files:
+                raise ValueError("No valid images found in the specified range.")
+
+        # Streaming mode: peak memory is bounded by the window instead of the slice
+        next_cursor = None
+        if window_size > 0:
+            slice_total = len(target_files)
+            offset = self._window_offset(
+                unique_id, folder_path, start_index, image_limit, window_size, slice_total
+            )
+            target_files = target_files[offset:offset + window_size]
+            end = offset + len(target_files)
+            print(f"DirectoryImageIterator: window {offset + 1}-{end} of {slice_total}")
+            next_cursor = ((folder_path, start_index, image_limit, window_size),
+                           end if end < slice_total else 0)
 
         out_images = []
         out_filenames = []
+        out_bucket_maps = []
         ui_images = []
         temp_dir = folder_paths.get_temp_directory()
         total = len(target_files)
 
-        for idx, filename in enumerate(target_files):
+        # Downscaled thumbnails for the preview widget live in a content-addressed
+        # cache in the ComfyUI temp dir: unchanged images reuse their thumbnail.
+        thumb_dir = os.path.join(temp_dir, THUMBNAIL_SUBFOLDER)
+        os.makedirs(thumb_dir, exist_ok=True)
+        stats = self._dir_index.stat_files(folder_path, target_files, self._cache_dir())
+        temp_filenames = []
+        jobs = []
+        max_pixels = int(max_megapixels * 1_000_000)
+        for filename, (size, mtime_ns) in zip(target_files, stats):
             img_path = os.path.join(folder_path, filename)
-            img = Image.open(img_path)
-            img = ImageOps.exif_transpose(img)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            # Downscaled thumbnail saved to ComfyUI temp dir for the preview widget.
-            # os.urandom avoids the random module and produces a secure unique prefix.
-            thumb = img.copy()
-            thumb.thumbnail((512, 512), Image.Resampling.LANCZOS)
-            temp_filename = f"iter_thumb_{os.urandom(8).hex()}_{filename}"
-            thumb.save(os.path.join(temp_dir, temp_filename), format="JPEG")
-            ui_entry = {"filename": temp_filename, "subfolder": "", "type": "temp", "original_filename": filename}
-            ui_images.append(ui_entry)
-
-            # Send real-time preview update to the JS frontend
-            if unique_id is not None and PromptServer is not None:
-                PromptServer.instance.send_sync("iterator_preview", {
-                    "node": str(unique_id),
-                    "index": idx,
-                    "total": total,
-                    "filename": temp_filename,
-                    "subfolder": "",
-                    "type": "temp",
-                    "original_filename": filename
-                })
-
-            img_array = np.array(img).astype(np.float32) / 255.0
-            out_images.append(torch.from_numpy(img_array).unsqueeze(0))
-            out_filenames.append(filename)
-
-        return {"ui": {"images": ui_images}, "result": (out_images, out_filenames)}
+            temp_filename = ThumbnailCache.thumb_name(img_path, size, mtime_ns)
+            cached = self._thumb_cache.lookup(thumb_dir, temp_filename)
+            temp_filenames.append(temp_filename)
+            jobs.append((img_path, None if cached else os.path.join(thumb_dir, temp_filename), max_pixels))
+        max_thumb_bytes = thumbnail_cache_mb * 1024 * 1024
+        # Thumbnails of the current slice are never evicted; a set keeps the
+        # membership test in the eviction loop O(1) for large slices
+        protected_thumbs = set(temp_filenames)
+
+        # Decoding runs on a worker pool with a bounded prefetch window;
+        # results arrive in submission order, so output order stays deterministic.
+        workers = decode_workers if decode_workers > 0 else min(8, os.cpu_count() or 1)
+
+        # Bucketing: image sizes come from the file headers, so every bucket
+        # can be preallocated as one [N,H,W,C] batch before decoding starts
+        buckets = None
+        if bucket_mode != "off":
+            sizes = list(_ordered_prefetch(
+                _probe_iterator_image_size, [(job[0], max_pixels) for job in jobs], workers, "thread"
+            ))
+            bucket_sizes, bucket_rows, placement = self._plan_buckets(sizes, bucket_mode, bucket_grid)
+            dtype = {"uint8": torch.uint8, "float16": torch.float16}.get(output_dtype, torch.float32)
+            buckets = [
+                torch.zeros((rows, height, width, 3), dtype=dtype)
+                for (width, height), rows in zip(bucket_sizes, bucket_rows)
+            ]
+            bucket_files = [[] for _ in buckets]
+
+        if source == "pack":
+            decoded = self._load_from_pack(folder_path, target_files, stats, jobs, max_pixels,
+                                           workers, decode_pool)
+        else:
+            decoded = _ordered_prefetch(_decode_iterator_image, jobs, workers, decode_pool)
+
+        # Preview events are coalesced: at most preview_rate_hz websocket messages
+        # per second, each carrying all thumbnails finished since the last one
+        preview_sender = None
+        if unique_id is not None and PromptServer is not None and preview_rate_hz > 0:
+            preview_sender = CoalescedEventSender(
+                PromptServer.instance.send_sync, "iterator_preview",
+                {"node": str(unique_id), "total": total}, preview_rate_hz,
+            )
+
+        try:
+            for idx, (filename, temp_filename, job, img_array) in enumerate(
+                zip(target_files, temp_filenames, jobs, decoded)
+            ):
+                if job[1] is not None:
+                    self._thumb_cache.add(thumb_dir, temp_filename, max_thumb_bytes, protect=protected_thumbs)
+
+                ui_entry = {"filename": temp_filename, "subfolder": THUMBNAIL_SUBFOLDER, "type": "temp", "original_filename": filename}
+                ui_images.append(ui_entry)
+
+                # Real-time preview update for the JS frontend (batched, sent off this thread)
+                if preview_sender is not None:
+                    preview_sender.add({"index": idx, **ui_entry})
+
+                img_tensor = self._to_output_tensor(img_array, output_dtype)
+                height, width = img_tensor.shape[:2]
+                if buckets is None:
+                    out_images.append(img_tensor.unsqueeze(0))
+                    out_filenames.append(filename)
+                    out_bucket_maps.append(json.dumps({
+                        "bucket": f"{width}x{height}", "width": width, "height": height, "mode": "off",
+                        "files": [{"row": 0, "filename": filename, "width": width, "height": height}],
+                    }))
+                else:
+                    b, row = placement[idx]
+                    if (width, height) != sizes[idx]:
+                        print(f"DirectoryImageIterator: unexpected size {width}x{height} for {filename}, "
+                              f"expected {sizes[idx][0]}x{sizes[idx][1]}")
+                    self._place_in_bucket(buckets[b][row], img_tensor)
+                    bucket_files[b].append({"row": row, "filename": filename, "width": width, "height": height})
+                del img_tensor
+        finally:
+            if preview_sender is not None:
+                preview_sender.close()
+
+        if buckets is not None:
+            # One batch per bucket; filename carries the bucket label, bucket_map
+            # maps the batch rows back to the source files
+            for (width, height), batch, files in zip(bucket_sizes, buckets, bucket_files):
+                label = f"bucket_{width}x{height}"
+                out_images.append(batch)
+                out_filenames.append(label)
+                out_bucket_maps.append(json.dumps({
+                    "bucket": f"{width}x{height}", "width": width, "height": height,
+                    "mode": bucket_mode, "files": files,
+                }))
+
+        # Advance only after the whole window was loaded successfully
+        if next_cursor is not None and unique_id is not None:
+            self._window_cursors[str(unique_id)] = next_cursor
+        # Hot-folder mode: emitted files stay pending until this prompt has
+        # finished successfully (committed by the next run, see _resolve_staged)
+        if manifest is not None:
+            manifest.stage(target_files, stats, incremental_hash, token=self._current_prompt_id())
+
+        return {"ui": {"images": ui_images}, "result": (out_images, out_filenames, out_bucket_maps)}
 
 
 class IteratorCurrentFilename:
@@ -575,11 +1704,27 @@ class MyImageStitch:
     def INPUT_TYPES(s):
         return {
             "required": {
-                "layout": (["Horizontal", "Vertical"],),
+                "layout": (["Horizontal", "Vertical", "Grid"],),
                 "padding": ("INT", {"default": 0, "min": 0, "max": 200, "step": 1}),
                 "order_payload": ("STRING", {"default": "[]"}),
             },
             "optional": {
+                # pil: bisheriges Verfahren (Standard, damit gespeicherte Workflows unverändert bleiben);
+                # tensor: Layout vorab, eine Ausgabe-Allokation, batch-fähig
+                "engine": (["pil", "tensor"], {
+                    "default": "pil",
+                    "tooltip": "pil = bisheriges Verfahren (LANCZOS, nur Frame 0); tensor = schneller, bicubic, "
+                               "gibt bei Batches alle Frames aus"
+                }),
+                # Grid (Kontaktabzug): alle Frames aller Eingänge in Zeilen und Spalten
+                "grid_columns": ("INT", {
+                    "default": 0, "min": 0, "max": 256, "step": 1,
+                    "tooltip": "Spalten im Grid-Layout; 0 = automatisch (annähernd quadratisch)"
+                }),
+                "grid_memmap": ("BOOLEAN", {
+                    "default": False,
+                    "tooltip": "Grid-Bogen in einer memory-mapped Datei im Temp-Verzeichnis aufbauen (für sehr große Bögen)"
+                }),
                 "image_1": ("IMAGE",),
                 "image_2": ("IMAGE",),
                 "image_3": ("IMAGE",),
@@ -601,7 +1746,9 @@ class MyImageStitch:
     FUNCTION = "stitch"
     CATEGORY = "image/compositing"
 
-    def stitch(self, layout, padding, order_payload, unique_id=None, **kwargs):
+    @staticmethod
+    def _ordered_inputs(order_payload, kwargs):
+        """Aktive Eingänge in der Reihenfolge des Frontend-Payloads: Liste von (Socket, Tensor)."""
         # Aktive Bilder sammeln
         active = {}
         for i in range(1, 11):
@@ -609,9 +1756,6 @@ class MyImageStitch:
             if key in kwargs and kwargs[key] is not None:
                 active[key] = kwargs[key]
 
-        if not active:
-            return (torch.zeros(1, 64, 64, 3, dtype=torch.float32),)
-
         # Reihenfolge aus dem Frontend-Payload parsen
         try:
             order = json.loads(order_payload)
@@ -621,27 +1765,170 @@ class MyImageStitch:
         # Geordnete Liste aufbauen
         ordered = []
         used = set()
-        if order:
+        if isinstance(order, list):
             for entry in order:
                 src = entry.get("source_socket") if isinstance(entry, dict) else None
                 if src and src in active and src not in used:
-                    ordered.append(active[src])
+                    ordered.append((src, active[src]))
                     used.add(src)
         # Verbleibende Bilder anfügen (nicht in order enthalten)
         for key in sorted(active.keys()):
             if key not in used:
-                ordered.append(active[key])
+                ordered.append((key, active[key]))
+        return ordered
+
+    def stitch(self, layout, padding, order_payload, engine="pil", grid_columns=0, grid_memmap=False,
+               unique_id=None, **kwargs):
+        ordered = [tensor for _, tensor in self._ordered_inputs(order_payload, kwargs)]
+        if not ordered:
+            return (torch.zeros(1, 64, 64, 3, dtype=torch.float32),)
 
+        if layout == "Grid":
+            return (self._stitch_grid(ordered, padding, grid_columns, grid_memmap),)
+        if engine == "tensor":
+            return (self._stitch_tensor(ordered, layout, padding),)
+        return (self._stitch_pil(ordered, layout, padding),)
+
+    @staticmethod
+    def _stitch_layout(sizes, layout, padding):
+        """
+        Berechnet das Layout aus den Bildgrößen [(Breite, Höhe)]: gemeinsame Höhe
+        (horizontal) bzw. Breite (vertikal), skalierte Größen und Offsets.
+        Rückgabe: (Canvas-Breite, Canvas-Höhe, [(x, y, Breite, Höhe)]).
+        """
+        if layout == "Horizontal":
+            target_h = max(h for _, h in sizes)
+            scaled = [(w if h == target_h else max(1, round(w * target_h / h)), target_h) for w, h in sizes]
+        else:
+            target_w = max(w for w, _ in sizes)
+            scaled = [(target_w, h if w == target_w else max(1, round(h * target_w / w))) for w, h in sizes]
+
+        placements = []
+        x_off, y_off = 0, 0
+        for w, h in scaled:
+            placements.append((x_off, y_off, w, h))
+            if layout == "Horizontal":
+                x_off += w + padding
+            else:
+                y_off += h + padding
+
+        gaps = padding * max(0, len(scaled) - 1)
+        if layout == "Horizontal":
+            return sum(w for w, _ in scaled) + gaps, max(h for _, h in scaled), placements
+        return max(w for w, _ in scaled), sum(h for _, h in scaled) + gaps, placements
+
+    @staticmethod
+    def _to_rgb(frames):
+        """[B,H,W,C] -> [B,H,W,3] float: Alpha wird vormultipliziert (entspricht Einfügen auf Schwarz)."""
+        frames = _as_float_image(frames)
+        channels = frames.shape[-1]
+        if channels == 4:
+            return frames[..., :3] * frames[..., 3:4]
+        if channels == 2:
+            # Graustufen + Alpha: Grauwert vormultiplizieren, dann auf 3 Kanäle
+            return (frames[..., :1] * frames[..., 1:2]).expand(*frames.shape[:-1], 3)
+        if channels == 1:
+            return frames.expand(*frames.shape[:-1], 3)
+        return frames[..., :3]
+
+    def _stitch_tensor(self, ordered, layout, padding):
+        """
+        Tensor-Engine: Layout zuerst berechnen, Ausgabe einmal allozieren und
+        jeden Eingang (alle Frames) per torch interpolate direkt in seinen
+        Ausschnitt des Canvas skalieren. Kürzere Batches wiederholen ihre Frames.
+        """
+        sizes = [(t.shape[-2], t.shape[-3]) for t in ordered]
+        total_w, total_h, placements = self._stitch_layout(sizes, layout, padding)
+        batch = max(t.shape[0] if t.dim() == 4 else 1 for t in ordered)
+
+        device = ordered[0].device
+        canvas = torch.zeros((batch, total_h, total_w, 3), dtype=torch.float32, device=device)
+        for tensor, (x, y, w, h) in zip(ordered, placements):
+            frames = tensor if tensor.dim() == 4 else tensor.unsqueeze(0)
+            # Einzelbilder werden nur einmal skaliert und in alle Frames kopiert
+            if frames.shape[0] == 1:
+                self._paste_frame(canvas[:, y:y + h, x:x + w], frames.to(device))
+                continue
+            for i in range(batch):
+                j = i % frames.shape[0]
+                self._paste_frame(canvas[i:i + 1, y:y + h, x:x + w], frames[j:j + 1].to(device))
+        return canvas
+
+    def _stitch_grid(self, ordered, padding, columns, use_memmap):
+        """
+        Kontaktabzug: jeder Frame jedes Eingangs (in Eingangsreihenfolge) wird in
+        eine Zelle eines R×C-Rasters gesetzt. Die Zellgröße ist die größte
+        Framegröße; kleinere bzw. andere Seitenverhältnisse werden
+        seitenverhältnistreu eingepasst und zentriert. Der Bogen wird einmal
+        alloziert (optional als memmap) und Zelle für Zelle gefüllt, so dass nie
+        eine weitere Kopie in voller Größe entsteht.
+        """
+        frames = []
+        for tensor in ordered:
+            tensor = tensor if tensor.dim() == 4 else tensor.unsqueeze(0)
+            frames.extend((tensor, i) for i in range(tensor.shape[0]))
+        count = len(frames)
+        cell_w = max(t.shape[2] for t, _ in frames)
+        cell_h = max(t.shape[1] for t, _ in frames)
+        cols = columns if columns > 0 else math.ceil(math.sqrt(count))
+        cols = min(cols, count)
+        rows = math.ceil(count / cols)
+        total_w = cols * cell_w + (cols - 1) * padding
+        total_h = rows * cell_h + (rows - 1) * padding
+
+        if use_memmap:
+            # Die Datei wird sofort wieder gelöscht; das Mapping bleibt gültig,
+            # solange der Tensor lebt (unter Windows bleibt sie bis dahin bestehen)
+            fd, sheet_path = tempfile.mkstemp(prefix="stitch_grid_", suffix=".bin",
+                                              dir=folder_paths.get_temp_directory())
+            os.close(fd)
+            buffer = np.memmap(sheet_path, dtype=np.float32, mode="w+", shape=(1, total_h, total_w, 3))
+            try:
+                os.remove(sheet_path)
+            except OSError:
+                pass
+            sheet = torch.from_numpy(buffer)
+        else:
+            sheet = torch.zeros((1, total_h, total_w, 3), dtype=torch.float32)
+
+        for index, (tensor, frame_index) in enumerate(frames):
+            row, col = divmod(index, cols)
+            x = col * (cell_w + padding)
+            y = row * (cell_h + padding)
+            h, w = tensor.shape[1:3]
+            scale = min(cell_w / w, cell_h / h)
+            fit_w = max(1, min(cell_w, round(w * scale)))
+            fit_h = max(1, min(cell_h, round(h * scale)))
+            x += (cell_w - fit_w) // 2
+            y += (cell_h - fit_h) // 2
+            frame = tensor[frame_index:frame_index + 1].to(sheet.device)
+            self._paste_frame(sheet[:, y:y + fit_h, x:x + fit_w], frame)
+            del frame
+        return sheet
+
+    def _paste_frame(self, target, frame):
+        """Skaliert ein [1,H,W,C]-Bild auf die Größe des Canvas-Ausschnitts und schreibt es hinein."""
+        frame = self._to_rgb(frame)
+        h, w = target.shape[1:3]
+        if frame.shape[1:3] != (h, w):
+            frame = torch.nn.functional.interpolate(
+                frame.movedim(-1, 1), size=(h, w), mode="bicubic", antialias=True, align_corners=False
+            ).clamp_(0.0, 1.0).movedim(1, -1)
+        target.copy_(frame)
+
+    def _stitch_pil(self, ordered, layout, padding):
+        """PIL-Engine (bisheriges Verfahren): nur Frame 0 je Eingang, LANCZOS, uint8-Rundreise."""
         # Tensoren zu PIL-Bildern konvertieren
         pil_images = []
         for tensor in ordered:
             t = tensor[0] if tensor.dim() == 4 else tensor
+            t = _as_float_image(t)
             arr = torch.clamp(t * 255.0, 0, 255).cpu().to(torch.uint8).numpy()
             pil_images.append(Image.fromarray(arr).convert("RGBA"))
             del t, arr
 
         if not pil_images:
-            return (torch.zeros(1, 64, 64, 3, dtype=torch.float32),)
+            return torch.zeros(1, 64, 64, 3, dtype=torch.float32)
 
         # Bilder auf gleiche Höhe (horizontal) bzw. gleiche Breite (vertikal) skalieren
         if layout == "Horizontal":
@@ -703,16 +1990,39 @@ class MyImageStitch:
         del canvas_rgb
         result = torch.from_numpy(np_result).unsqueeze(0)
 
-        return (result,)
+        return result
+
+    @staticmethod
+    def _normalized_order(order_payload):
+        """Nur die Socket-Reihenfolge aus dem Payload (ohne Duplikate), unabhängig von der JSON-Formatierung."""
+        try:
+            order = json.loads(order_payload)
+        except (json.JSONDecodeError, TypeError):
+            return []
+        if not isinstance(order, list):
+            return []
+        sockets = []
+        for entry in order:
+            src = entry.get("source_socket") if isinstance(entry, dict) else None
+            if isinstance(src, str) and src not in sockets:
+                sockets.append(src)
+        return sockets
 
     @classmethod
-    def IS_CHANGED(s, **kwargs):
-        return float("NaN")
+    def IS_CHANGED(s, layout="Horizontal", padding=0, order_payload="[]", engine="pil",
+                   grid_columns=0, grid_memmap=False, **kwargs):
+        # Deterministisch statt immer NaN: Bildinhalte ändern sich nur über die
+        # vorgelagerten Nodes, und deren Änderungen erkennt ComfyUI selbst.
+        # Hier zählen nur Layout, Abstand, Engine, Grid-Optionen und die normalisierte Reihenfolge.
+        key = json.dumps([layout, padding, engine, grid_columns, grid_memmap, s._normalized_order(order_payload)])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
 
 NODE_CLASS_MAPPINGS = {
     "RGBA_to_RGB_Lossless": RGBA_to_RGB_Lossless,
     "SaveImageWithSidecarTxt_V2": SaveImageWithSidecarTxt_V2,
+    "SaveImageToTarShards": SaveImageToTarShards,
+    "EncoderProfileBenchmark": EncoderProfileBenchmark,
     "MegapixelResizeNode": MegapixelResizeNode,
     "DirectoryImageIterator": DirectoryImageIterator,
     "IteratorCurrentFilename": IteratorCurrentFilename,
@@ -722,6 +2032,8 @@ NODE_CLASS_MAPPINGS = {
 NODE_DISPLAY_NAME_MAPPINGS = {
     "RGBA_to_RGB_Lossless": "RGBA zu RGB (Verlustfrei)",
     "SaveImageWithSidecarTxt_V2": "Bild mit Sidecar TXT speichern V2",
+    "SaveImageToTarShards": "Bilder in Tar-Shards speichern (WebDataset)",
+    "EncoderProfileBenchmark": "Encoder-Profil Benchmark",
     "MegapixelResizeNode": "Megapixel Resize",
     "DirectoryImageIterator": "Directory Image Iterator",
     "IteratorCurrentFilename": "Iterator Current Filename",
@@ -0,0 +1,546 @@
+# ComfyUI - Iterator Helpers - Elmar Krüger - 2026
+#
+# Shared infrastructure for DirectoryImageIterator in image_nodes.py.
+# Like save_utils.py, this module depends only on the standard library (plus
+# numpy where noted) so that it can be imported and tested without a ComfyUI install.
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+CACHE_DIRNAME = "my_utility_nodes_cache"
+
+# A directory listing is only trusted if it was taken at least this long after
+# the directory's last modification. Otherwise a file created within the same
+# mtime tick as the scan could go unnoticed (same idea as git's "racy" check).
+_RACY_WINDOW_NS = 2_000_000_000
+
+
+def _cache_key(folder):
+    return hashlib.sha1(folder.encode("utf-8", "surrogateescape")).hexdigest()[:20]
+
+
+class DirectoryIndex:
+    """
+    Cached, sorted listing of image files per folder.
+
+    For each folder the index keeps the sorted names plus (size, mtime_ns) per
+    file, built with os.scandir and persisted as JSON in `cache_dir`. A lookup
+    costs a single stat of the directory: as long as its mtime is unchanged the
+    cached listing is reused. When it changed, the folder is re-listed and only
+    new names are stat'ed, removed names are dropped. Edits of existing files do
+    not touch the directory mtime, so callers refresh the stats of the files
+    they actually use via stat_files().
+    """
+
+    def __init__(self, extensions):
+        self._extensions = tuple(extensions)
+        self._lock = threading.Lock()
+        self._folders = {}
+
+    def list_files(self, folder, cache_dir=None):
+        """Sorted names of all matching files in `folder`."""
+        return self._get(folder, cache_dir)["names"]
+
+    def slice(self, folder, start_index, image_limit, cache_dir=None):
+        """Same slicing rules as before: image_limit = 0 means all remaining files."""
+        names = self.list_files(folder, cache_dir)
+        end_idx = start_index + image_limit if image_limit > 0 else len(names)
+        return names[start_index:end_idx]
+
+    def stat_files(self, folder, names, cache_dir=None):
+        """
+        Fresh (size, mtime_ns) for `names` (one stat per file). Missing files
+        report (-1, -1). Changed values are written back into the index.
+        """
+        entry = self._get(folder, cache_dir)
+        result = []
+        for name in names:
+            try:
+                st = os.stat(os.path.join(folder, name))
+                result.append((st.st_size, st.st_mtime_ns))
+            except OSError:
+                result.append((-1, -1))
+        with self._lock:
+            stats = entry["stats"]
+            changed = False
+            for name, value in zip(names, result):
+                if value[0] >= 0 and stats.get(name) != value:
+                    stats[name] = value
+                    changed = True
+            if changed:
+                self._save(folder, entry, cache_dir)
+        return result
+
+    def _get(self, folder, cache_dir):
+        st = os.stat(folder)
+        with self._lock:
+            entry = self._folders.get(folder)
+            if entry is None:
+                entry = self._load(folder, cache_dir)
+            if entry is None or entry["dir_mtime_ns"] != st.st_mtime_ns \
+                    or entry["scanned_ns"] - entry["dir_mtime_ns"] < _RACY_WINDOW_NS:
+                old_entry = entry
+                entry = self._refresh(folder, old_entry, st.st_mtime_ns)
+                if old_entry is None or old_entry["dir_mtime_ns"] != entry["dir_mtime_ns"] \
+                        or old_entry["names"] != entry["names"]:
+                    self._save(folder, entry, cache_dir)
+            self._folders[folder] = entry
+        return entry
+
+    def _refresh(self, folder, entry, dir_mtime_ns):
+        old_stats = entry["stats"] if entry is not None else {}
+        scanned_ns = time.time_ns()
+        stats = {}
+        with os.scandir(folder) as it:
+            for de in it:
+                name = de.name
+                if not name.lower().endswith(self._extensions):
+                    continue
+                known = old_stats.get(name)
+                if known is not None:
+                    stats[name] = known
+                    continue
+                try:
+                    if not de.is_file():
+                        continue
+                    st = de.stat()
+                except OSError:
+                    continue
+                stats[name] = (st.st_size, st.st_mtime_ns)
+        return {
+            "dir_mtime_ns": dir_mtime_ns,
+            "scanned_ns": scanned_ns,
+            "names": sorted(stats),
+            "stats": stats,
+        }
+
+    def _index_path(self, folder, cache_dir):
+        return os.path.join(cache_dir, f"dirindex_{_cache_key(folder)}.json")
+
+    def _load(self, folder, cache_dir):
+        if not cache_dir:
+            return None
+        try:
+            with open(self._index_path(folder, cache_dir), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("folder") != folder or list(data.get("extensions", ())) != list(self._extensions):
+                return None
+            stats = {str(k): (int(v[0]), int(v[1])) for k, v in data["stats"].items()}
+            return {
+                "dir_mtime_ns": int(data["dir_mtime_ns"]),
+                "scanned_ns": int(data["scanned_ns"]),
+                "names": sorted(stats),
+                "stats": stats,
+            }
+        except (OSError, ValueError, KeyError, TypeError, IndexError, AttributeError):
+            return None
+
+    def _save(self, folder, entry, cache_dir):
+        if not cache_dir:
+            return
+        path = self._index_path(folder, cache_dir)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "folder": folder,
+                    "extensions": list(self._extensions),
+                    "dir_mtime_ns": entry["dir_mtime_ns"],
+                    "scanned_ns": entry["scanned_ns"],
+                    "stats": entry["stats"],
+                }, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error: could not write directory index {path}: {e}")
+
+
+THUMBNAIL_SUBFOLDER = "iter_thumbs"
+
+
+class ThumbnailCache:
+    """
+    Content-addressed cache for iterator preview thumbnails with LRU eviction.
+
+    Thumbnails live in `<folder>/iter_thumb_<key>_<filename>`, where key is
+    derived from source path, size and mtime_ns, so an unchanged source image
+    maps to the same file on every run and is never rendered twice. The cache
+    tracks the total size of its files and evicts the least recently used ones
+    once `max_bytes` is exceeded. Rendering itself happens elsewhere (possibly in
+    a worker process); callers report new files through add().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._folders = {}
+        # Running byte total per folder, so add() never sums the whole cache
+        self._totals = {}
+        # folder -> protect set for which nothing evictable was left
+        self._exhausted = {}
+
+    @staticmethod
+    def thumb_name(source_path, size, mtime_ns):
+        key = hashlib.sha1(
+            f"{source_path}|{size}|{mtime_ns}".encode("utf-8", "surrogateescape")
+        ).hexdigest()[:16]
+        return f"iter_thumb_{key}_{os.path.basename(source_path)}"
+
+    def lookup(self, folder, name):
+        """True if `name` is cached in `folder`; marks it as recently used."""
+        with self._lock:
+            entries = self._load(folder)
+            if name not in entries:
+                return False
+            if not os.path.exists(os.path.join(folder, name)):
+                self._totals[folder] -= entries.pop(name)
+                return False
+            entries.move_to_end(name)
+            return True
+
+    def add(self, folder, name, max_bytes, protect=()):
+        """
+        Registers a freshly written thumbnail and evicts old ones beyond max_bytes.
+        Names in `protect` (a set, checked per eviction candidate) are kept.
+        """
+        try:
+            size = os.path.getsize(os.path.join(folder, name))
+        except OSError:
+            return
+        with self._lock:
+            entries = self._load(folder)
+            total = self._totals[folder] - entries.get(name, 0) + size
+            entries[name] = size
+            entries.move_to_end(name)
+            if total > max_bytes and not (self._exhausted.get(folder) is protect and name in protect):
+                # Walk from the least recently used end. Protected entries are in
+                # use by the current slice and move to the recent end, so every
+                # other entry is visited at most once per call.
+                for _ in range(len(entries) - 1):
+                    old_name = next(iter(entries))
+                    if old_name in protect:
+                        entries.move_to_end(old_name)
+                        continue
+                    total -= entries.pop(old_name)
+                    try:
+                        os.remove(os.path.join(folder, old_name))
+                    except OSError:
+                        pass
+                    if total <= max_bytes:
+                        break
+                else:
+                    # Only protected thumbnails are left: further adds for the
+                    # same slice cannot free anything, skip the walk for them
+                    if name in protect:
+                        self._exhausted[folder] = protect
+            self._totals[folder] = total
+
+    def _load(self, folder):
+        entries = self._folders.get(folder)
+        if entries is None:
+            # Thumbnails left over from earlier runs, oldest first
+            found = []
+            try:
+                with os.scandir(folder) as it:
+                    for de in it:
+                        if de.name.startswith("iter_thumb_") and not de.name.endswith(".tmp") and de.is_file():
+                            st = de.stat()
+                            found.append((st.st_mtime_ns, de.name, st.st_size))
+            except OSError:
+                pass
+            entries = OrderedDict((name, size) for _, name, size in sorted(found))
+            self._folders[folder] = entries
+            self._totals[folder] = sum(entries.values())
+        return entries
+
+
+class ImagePack:
+    """
+    Memory-mapped uint8 container of decoded images for one source folder.
+
+    `<key>.bin` holds the raw [H,W,3] pixel arrays back to back, `<key>.json`
+    maps each source filename to (offset, shape) plus the size/mtime_ns of the
+    source file it was decoded from. Images are appended as they are decoded for
+    the first time; afterwards read() returns a copy-on-write memmap view, so a
+    packed image costs neither a decode nor a copy until it is converted. Entries
+    whose source size/mtime changed count as stale and are decoded again, and
+    entries of deleted source files are dropped by prune(); the dead bytes are
+    reclaimed by compact() once they outweigh the live ones.
+    Appended data only becomes visible to other runs after flush().
+    numpy is imported lazily (only needed for read()).
+    """
+
+    def __init__(self, cache_dir, folder, max_pixels=0):
+        key = _cache_key(f"{folder}|{max_pixels}")
+        self.bin_path = os.path.join(cache_dir, f"pack_{key}.bin")
+        self.index_path = os.path.join(cache_dir, f"pack_{key}.json")
+        self.folder = folder
+        self.max_pixels = max_pixels
+        self._map = None
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("folder") != self.folder or data.get("max_pixels") != self.max_pixels:
+                return {}
+            bin_size = os.path.getsize(self.bin_path)
+            entries = {}
+            for name, e in data["files"].items():
+                h, w, c = e["shape"]
+                # Ignore entries beyond the end of the data file (interrupted append)
+                if e["offset"] + h * w * c <= bin_size:
+                    entries[name] = e
+            return entries
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"folder": self.folder, "max_pixels": self.max_pixels, "files": self._entries}, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"Error: could not write image pack index {self.index_path}: {e}")
+
+    def lookup(self, name, size, mtime_ns):
+        """Index entry for `name` if it was packed from the current file version, else None."""
+        e = self._entries.get(name)
+        if e is None or e["size"] != size or e["mtime_ns"] != mtime_ns:
+            return None
+        return e
+
+    def prune(self, names):
+        """
+        Drops entries whose source file is no longer in `names` (deleted from the
+        folder), so their bytes count as dead for compact(). Returns the number
+        of dropped entries; call flush() to persist.
+        """
+        names = names if isinstance(names, (set, frozenset, dict)) else set(names)
+        gone = [name for name in self._entries if name not in names]
+        for name in gone:
+            del self._entries[name]
+        return len(gone)
+
+    def append(self, items):
+        """Appends [(name, size, mtime_ns, uint8 array)] to the data file; see flush()."""
+        if not items:
+            return
+        os.makedirs(os.path.dirname(self.bin_path), exist_ok=True)
+        with open(self.bin_path, "ab") as f:
+            offset = f.tell()
+            for name, size, mtime_ns, array in items:
+                data = memoryview(array).cast("B") if array.flags.c_contiguous else array.tobytes()
+                f.write(data)
+                self._entries[name] = {
+                    "offset": offset, "shape": list(array.shape),
+                    "size": size, "mtime_ns": mtime_ns,
+                }
+                offset += array.nbytes
+        self._map = None
+
+    def flush(self):
+        """Compacts the data file if needed and persists the index."""
+        self.compact()
+        self._save()
+
+    def read(self, entry):
+        """Zero-copy (copy-on-write) uint8 view of a packed image."""
+        import numpy as np
+
+        if self._map is None:
+            self._map = np.memmap(self.bin_path, dtype=np.uint8, mode="c")
+        h, w, c = entry["shape"]
+        start = entry["offset"]
+        return self._map[start:start + h * w * c].reshape(h, w, c)
+
+    def compact(self):
+        """Rewrites the data file without stale bytes once they exceed the live data."""
+        try:
+            total = os.path.getsize(self.bin_path)
+        except OSError:
+            return
+        live = sum(e["shape"][0] * e["shape"][1] * e["shape"][2] for e in self._entries.values())
+        if total - live <= live:
+            return
+        tmp_path = f"{self.bin_path}.{os.getpid()}.tmp"
+        new_entries = {}
+        try:
+            with open(self.bin_path, "rb") as src, open(tmp_path, "wb") as dst:
+                for name, e in sorted(self._entries.items(), key=lambda item: item[1]["offset"]):
+                    length = e["shape"][0] * e["shape"][1] * e["shape"][2]
+                    src.seek(e["offset"])
+                    new_entries[name] = dict(e, offset=dst.tell())
+                    dst.write(src.read(length))
+            self._map = None
+            os.replace(tmp_path, self.bin_path)
+            self._entries = new_entries
+        except OSError as e:
+            # e.g. the data file is still mapped on Windows; retry on the next append
+            print(f"Image pack compaction skipped: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    """Streaming SHA-1 of a file's content."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ProcessedManifest:
+    """
+    On-disk record of the files an incremental (hot-folder) iterator already
+    emitted: {name: [size, mtime_ns, sha1 or null]}.
+
+    select() returns the names that are new or changed since they were committed.
+    With use_hash, a file whose size/mtime changed but whose content hash is
+    unchanged (touched, copied with new timestamps, ...) is not emitted again.
+
+    Emitted files are not committed right away: stage() records them together
+    with a token (the prompt id) as pending, and the caller commits them with
+    commit_staged() once that run is known to have succeeded, or drops the
+    staging with discard_staged() so they are selected again.
+    """
+
+    def __init__(self, cache_dir, folder, manifest_name):
+        key = _cache_key(f"{folder}|{manifest_name}")
+        self.path = os.path.join(cache_dir, f"manifest_{key}.json")
+        self.folder = folder
+        self._entries = {}
+        self._staged = None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("folder") == folder:
+                self._entries = {str(k): list(v) for k, v in data["files"].items()}
+                staged = data.get("staged")
+                if staged is not None:
+                    self._staged = {"token": staged.get("token"),
+                                    "files": {str(k): list(v) for k, v in staged["files"].items()}}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+
+    @property
+    def staged_token(self):
+        """Token of the staged (emitted but uncommitted) run; None if nothing is staged."""
+        return self._staged["token"] if self._staged is not None else None
+
+    @property
+    def has_staged(self):
+        return self._staged is not None
+
+    def select(self, names, stats, use_hash=False):
+        selected = []
+        refreshed = False
+        for name, (size, mtime_ns) in zip(names, stats):
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] == size and entry[1] == mtime_ns:
+                continue
+            if use_hash and entry is not None and entry[2] is not None and entry[0] == size:
+                try:
+                    if file_sha1(os.path.join(self.folder, name)) == entry[2]:
+                        # Same content, new timestamp: remember the new stat
+                        entry[1] = mtime_ns
+                        refreshed = True
+                        continue
+                except OSError:
+                    continue
+            if size >= 0:
+                selected.append(name)
+        if refreshed:
+            self.save()
+        return selected
+
+    def stage(self, names, stats, use_hash=False, token=None):
+        """Records `names` as emitted by the run `token` (pending commit) and saves the manifest."""
+        files = {}
+        for name, (size, mtime_ns) in zip(names, stats):
+            digest = None
+            if use_hash:
+                try:
+                    digest = file_sha1(os.path.join(self.folder, name))
+                except OSError:
+                    pass
+            files[name] = [size, mtime_ns, digest]
+        self._staged = {"token": token, "files": files}
+        self.save()
+
+    def commit_staged(self):
+        """Marks the staged files as processed."""
+        if self._staged is None:
+            return
+        self._entries.update(self._staged["files"])
+        self._staged = None
+        self.save()
+
+    def discard_staged(self):
+        """Forgets the staged files, so they are selected again."""
+        if self._staged is None:
+            return
+        self._staged = None
+        self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"folder": self.folder, "files": self._entries, "staged": self._staged}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error: could not write manifest {self.path}: {e}")
+
+
+class CoalescedEventSender:
+    """
+    Rate-limited, batched event channel for progress messages.
+
+    add() only appends to a buffer, so the caller's loop is never blocked by the
+    websocket. A background thread sends all entries collected since the last
+    flush as one `{**header, "entries": [...]}` message, at most `rate_hz` times
+    per second. close() sends whatever is still buffered and stops the thread.
+    """
+
+    def __init__(self, send_fn, event, header, rate_hz):
+        self._send_fn = send_fn
+        self._event = event
+        self._header = dict(header)
+        self._interval = 1.0 / rate_hz
+        self._lock = threading.Lock()
+        self._entries = []
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"{event}-sender", daemon=True)
+        self._thread.start()
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def _flush(self):
+        with self._lock:
+            entries, self._entries = self._entries, []
+        if entries:
+            try:
+                self._send_fn(self._event, {**self._header, "entries": entries})
+            except Exception as e:
+                print(f"Error: could not send {self._event}: {e}")
+
+    def _run(self):
+        while not self._closed.wait(self._interval):
+            self._flush()
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self._flush()
@@ -2,31 +2,48 @@ import { api } from "../../scripts/api.js";
 import { app } from "../../scripts/app.js";
 
 // ── Global: Real-time preview updates from Python backend ──────────────────
-// Receives per-image progress messages sent by PromptServer during load_images().
-// Fires BEFORE onExecuted, giving immediate visual feedback as each image loads.
-api.addEventListener("iterator_preview", function (event) {
-    const data = event.detail;
-    if (!data?.node) return;
-
-    const node = app.graph.getNodeById(parseInt(data.node));
-    if (!node) return;
-
-    if (!node._loadingPreviews) node._loadingPreviews = [];
-
-    const idx = data.index;
-    const url = `/view?filename=${encodeURIComponent(data.filename)}&type=${data.type}&subfolder=${data.subfolder}&t=${Date.now()}`;
+// Receives progress messages sent by PromptServer during load_images().
+// Fires BEFORE onExecuted, giving immediate visual feedback as images load.
+// The backend coalesces updates: one message carries an "entries" array with
+// every thumbnail finished since the previous message. The older single-entry
+// payload ({index, filename, ...} at top level) is still accepted.
+function handlePreviewEntry(node, entry, total) {
+    const idx = entry.index;
+    const url = `/view?filename=${encodeURIComponent(entry.filename)}&type=${entry.type}&subfolder=${entry.subfolder}&t=${Date.now()}`;
     const img = new Image();
     img.onload = () => {
         // Always advance to show the most recently loaded image
         if (idx >= (node._currentPreviewIndex ?? -1)) {
             node._currentPreviewIndex = idx;
-            node._loadingTotal = data.total;
+            node._loadingTotal = total;
             node.previewImg = img;
             node.setDirtyCanvas(true, true);
         }
     };
     img.src = url;
     node._loadingPreviews[idx] = img;
+}
+
+api.addEventListener("iterator_preview", function (event) {
+    const data = event.detail;
+    if (!data?.node) return;
+
+    const node = app.graph.getNodeById(parseInt(data.node));
+    if (!node) return;
+
+    if (!node._loadingPreviews) node._loadingPreviews = [];
+
+    const entries = Array.isArray(data.entries) ? data.entries : [data];
+    if (entries.length === 0) return;
+
+    // Only the newest thumbnail of a batch is displayed, so only that one
+    // triggers a redraw; the others are loaded for pagination
+    for (const entry of entries.slice(0, -1)) {
+        const img = new Image();
+        img.src = `/view?filename=${encodeURIComponent(entry.filename)}&type=${entry.type}&subfolder=${entry.subfolder}&t=${Date.now()}`;
+        node._loadingPreviews[entry.index] = img;
+    }
+    handlePreviewEntry(node, entries[entries.length - 1], data.total);
 });
 
 app.registerExtension({
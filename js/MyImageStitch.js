@@ -184,7 +184,7 @@ class ImageStitchHandler {
         const p = this.PAD;
 
         let w, h;
-        if (this.layout === "Horizontal") {
+        if (this.layout !== "Vertical") {
             w = count * ts + Math.max(0, count - 1) * g + p * 2;
             h = ts + p * 2 + this.LABEL_HEIGHT;
         } else {
@@ -207,7 +207,7 @@ class ImageStitchHandler {
         const g = this.GAP;
         const p = this.PAD;
 
-        if (this.layout === "Horizontal") {
+        if (this.layout !== "Vertical") {
             return {
                 x: area.x + p + index * (ts + g),
                 y: area.y + p,
@@ -274,7 +274,7 @@ class ImageStitchHandler {
         ctx.textAlign = "left";
         ctx.textBaseline = "top";
         ctx.fillText(
-            this.layout === "Horizontal" ? "▸ Horizontal" : "▾ Vertikal",
+            { Horizontal: "▸ Horizontal", Vertical: "▾ Vertikal", Grid: "▦ Raster" }[this.layout] ?? this.layout,
             area.x + 5, area.y + 3
         );
 
@@ -1,6 +1,8 @@
 # ComfyUI - Latent Space Nodes - Elmar Krüger - 2025
 import torch
 
+from .tiling_utils import accumulate_tile, hann_window, normalize_overlap_add
+
 
 class EmptyQwen2512LatentImage:
     """
@@ -207,8 +209,10 @@ class VAEDecodeAudioTiled(IO.ComfyNode):
         total_samples = total_steps * upscale_ratio
         
         # Allocate CPU buffer
+        # The weights are identical for batch and channels, so one row is enough
+        # (broadcast by the shared overlap-add helpers in tiling_utils.py).
         output_buffer = torch.zeros((batch_size, 2, total_samples), dtype=torch.float32, device="cpu")
-        weight_buffer = torch.zeros((batch_size, 2, total_samples), dtype=torch.float32, device="cpu")
+        weight_buffer = torch.zeros((1, 1, total_samples), dtype=torch.float32, device="cpu")
         
         stride = tile_size - overlap
         
@@ -229,23 +233,21 @@ class VAEDecodeAudioTiled(IO.ComfyNode):
             
             # Create Window
             current_audio_len = cpu_tile.shape[-1]
-            window = torch.hann_window(current_audio_len, device="cpu").view(1, 1, -1)
+            window = hann_window(current_audio_len, device="cpu").view(1, 1, -1)
             
             # Calculate buffer placement
             sample_start = start_idx * upscale_ratio
             sample_end = sample_start + current_audio_len
             
             # Accumulate
-            output_buffer[:, :, sample_start:sample_end] += cpu_tile * window
-            weight_buffer[:, :, sample_start:sample_end] += window
+            accumulate_tile(output_buffer, weight_buffer, cpu_tile, window, (Ellipsis, slice(sample_start, sample_end)))
             
             # VRAM Cleanup
             del gpu_latent, decoded_tile
             torch.cuda.empty_cache() # Optional, aggressive cleanup
 
         # Normalize weights
-        mask = weight_buffer > 1e-6
-        output_buffer[mask] /= weight_buffer[mask]
+        normalize_overlap_add(output_buffer, weight_buffer)
         
         # Global STD Normalization (on CPU)
         std = torch.std(output_buffer, dim=(1, 2), keepdim=True) * 5.0
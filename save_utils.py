@@ -0,0 +1,782 @@
+# ComfyUI - Save Helpers - Elmar Krüger - 2026
+#
+# Shared infrastructure for the save nodes in image_nodes.py and audio_nodes.py.
+# This module deliberately depends only on the standard library (plus PIL/numpy
+# where noted) so that external tooling can import it without a ComfyUI install.
+import atexit
+import hashlib
+import io
+import json
+import os
+import queue
+import re
+import struct
+import tarfile
+import threading
+import time
+import zlib
+
+
+class WriteBehindSaveQueue:
+    """
+    Bounded job queue drained by a pool of encoder threads.
+
+    Save nodes hand fully prepared jobs (uint8 frames, target paths, metadata)
+    to submit() and return immediately, so the next prompt can start sampling
+    while PNG/JPEG/WEBP encoding runs in the background. When the queue is full,
+    submit() blocks until a worker frees a slot (backpressure), which bounds the
+    number of frames held in memory. All pending jobs are flushed on interpreter
+    shutdown.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._workers = []
+        self._num_workers = 0
+        self._max_pending = 0
+
+    def configure(self, num_workers, max_pending):
+        """(Re)starts the worker pool if the requested size differs from the current one."""
+        num_workers = max(1, int(num_workers))
+        max_pending = max(1, int(max_pending))
+        with self._lock:
+            if (
+                self._queue is not None
+                and num_workers == self._num_workers
+                and max_pending == self._max_pending
+            ):
+                return
+            self._stop_locked()
+            self._queue = queue.Queue(maxsize=max_pending)
+            self._num_workers = num_workers
+            self._max_pending = max_pending
+            for idx in range(num_workers):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    args=(self._queue,),
+                    name=f"save-encoder-{idx}",
+                    daemon=True,
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, fn, *args, **kwargs):
+        """Enqueues fn(*args, **kwargs); blocks while the queue is full."""
+        if self._queue is None:
+            self.configure(1, 1)
+        self._queue.put((fn, args, kwargs))
+
+    def flush(self):
+        """Blocks until every submitted job has been written."""
+        q = self._queue
+        if q is not None:
+            q.join()
+
+    def shutdown(self):
+        """Flushes pending jobs and stops all workers."""
+        with self._lock:
+            self._stop_locked()
+
+    def _stop_locked(self):
+        if self._queue is None:
+            return
+        self._queue.join()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        self._queue = None
+        self._num_workers = 0
+        self._max_pending = 0
+
+    @staticmethod
+    def _worker_loop(q):
+        while True:
+            job = q.get()
+            try:
+                if job is None:
+                    return
+                fn, args, kwargs = job
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Error: write-behind save failed: {e}")
+            finally:
+                q.task_done()
+
+
+# Process-wide queue shared by all save node instances
+SAVE_QUEUE = WriteBehindSaveQueue()
+atexit.register(SAVE_QUEUE.shutdown)
+
+
+# ---------------------------------------------------------------------------
+# Deduplicated workflow/prompt metadata
+# ---------------------------------------------------------------------------
+
+METADATA_STORE_DIRNAME = ".metadata"
+METADATA_REF_KEY = "metadata_ref"
+SIDECAR_PNG_KEY = "sidecar"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+_metadata_lock = threading.Lock()
+
+
+def serialize_metadata(prompt=None, extra_pnginfo=None):
+    """Serializes prompt + extra_pnginfo once into the canonical store payload (bytes)."""
+    payload = {}
+    if prompt is not None:
+        payload["prompt"] = prompt
+    if extra_pnginfo is not None:
+        payload.update(extra_pnginfo)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def store_metadata(folder, payload):
+    """
+    Writes the payload once into the content-addressed store below `folder`
+    and returns the reference string ("sha256:<hex>") to embed in each image.
+    """
+    digest = hashlib.sha256(payload).hexdigest()
+    store_dir = os.path.join(folder, METADATA_STORE_DIRNAME)
+    store_path = os.path.join(store_dir, f"{digest}.json")
+    with _metadata_lock:
+        if not os.path.exists(store_path):
+            os.makedirs(store_dir, exist_ok=True)
+            tmp_path = f"{store_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, store_path)
+    return f"sha256:{digest}"
+
+
+def _find_metadata_file(image_path, ref, max_levels=4):
+    """Looks for the store file next to the image and in up to `max_levels` parent folders."""
+    digest = ref.split(":", 1)[-1]
+    folder = os.path.dirname(os.path.abspath(image_path))
+    for _ in range(max_levels + 1):
+        candidate = os.path.join(folder, METADATA_STORE_DIRNAME, f"{digest}.json")
+        if os.path.exists(candidate):
+            return candidate
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            break
+        folder = parent
+    raise FileNotFoundError(f"Metadata store entry {ref} not found for {image_path}")
+
+
+def _iter_png_chunks(f):
+    if f.read(8) != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = struct.unpack(">I4s", header)
+        yield length, chunk_type
+        if chunk_type == b"IEND":
+            return
+
+
+def read_png_text_chunks(path):
+    """
+    Returns all tEXt/zTXt/iTXt chunks of a PNG as {key: text} without decoding
+    any pixel data (IDAT chunks are skipped with a seek).
+    """
+    texts = {}
+    with open(path, "rb") as f:
+        for length, chunk_type in _iter_png_chunks(f):
+            if chunk_type not in (b"tEXt", b"zTXt", b"iTXt"):
+                f.seek(length + 4, os.SEEK_CUR)
+                continue
+            data = f.read(length)
+            f.seek(4, os.SEEK_CUR)
+            key, _, rest = data.partition(b"\0")
+            key = key.decode("latin-1")
+            if chunk_type == b"tEXt":
+                texts[key] = rest.decode("latin-1")
+            elif chunk_type == b"zTXt":
+                texts[key] = zlib.decompress(rest[1:]).decode("latin-1")
+            else:
+                compressed, _method = rest[0], rest[1]
+                _lang, _, rest = rest[2:].partition(b"\0")
+                _translated, _, text = rest.partition(b"\0")
+                if compressed:
+                    text = zlib.decompress(text)
+                texts[key] = text.decode("utf-8")
+    return texts
+
+
+def load_image_metadata(image_path):
+    """
+    Returns the full workflow/prompt metadata of a saved PNG as {key: object}.
+
+    Images written in "deduplicated" mode only carry a METADATA_REF_KEY chunk;
+    the referenced store file is resolved and loaded transparently.
+    """
+    texts = read_png_text_chunks(image_path)
+    if METADATA_REF_KEY in texts:
+        with open(_find_metadata_file(image_path, texts[METADATA_REF_KEY]), "rb") as f:
+            return json.load(f)
+    metadata = {}
+    for key, text in texts.items():
+        if key == SIDECAR_PNG_KEY:
+            continue
+        try:
+            metadata[key] = json.loads(text)
+        except ValueError:
+            metadata[key] = text
+    return metadata
+
+
+def _png_chunk(chunk_type, data):
+    crc = zlib.crc32(chunk_type + data) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
+
+
+def _png_text_chunk(key, text):
+    # Same rule as PIL's PngInfo.add_text: tEXt if latin-1 encodable, otherwise iTXt
+    try:
+        return _png_chunk(b"tEXt", key.encode("latin-1") + b"\0" + text.encode("latin-1"))
+    except UnicodeEncodeError:
+        data = key.encode("latin-1") + b"\0\0\0\0\0" + text.encode("utf-8")
+        return _png_chunk(b"iTXt", data)
+
+
+def rehydrate_png_metadata(image_path, output_path=None):
+    """
+    Rewrites a deduplicated PNG with its full metadata embedded again (e.g. for
+    dragging it into ComfyUI). Works on the chunk level, pixels are not re-encoded.
+    Writes in place if output_path is None.
+    """
+    metadata = load_image_metadata(image_path)
+    text_chunks = b"".join(
+        _png_text_chunk(key, json.dumps(value)) for key, value in metadata.items()
+    )
+    out = bytearray(PNG_SIGNATURE)
+    with open(image_path, "rb") as f:
+        for length, chunk_type in _iter_png_chunks(f):
+            data = f.read(length)
+            crc = f.read(4)
+            if chunk_type in (b"tEXt", b"iTXt") and data.split(b"\0", 1)[0] == METADATA_REF_KEY.encode():
+                out += text_chunks
+                continue
+            out += struct.pack(">I", length) + chunk_type + data + crc
+    output_path = output_path or image_path
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(out)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+# ---------------------------------------------------------------------------
+# Persistent filename counters
+# ---------------------------------------------------------------------------
+
+COUNTER_INDEX_FILENAME = ".counter_index.json"
+
+
+class FilenameCounterIndex:
+    """
+    Persistent next-counter index for output folders with very many files.
+
+    Each folder gets a small `.counter_index.json` ({key: next_counter}) that is
+    cached in memory after the first read. Only the first save for a key pays
+    for a full directory scan (`seed`); afterwards a reservation costs one stat
+    per reserved file (`is_taken`). If that probe hits an existing file (files
+    added outside the node, a second ComfyUI instance, ...), the index is
+    considered drifted and is repaired from a fresh scan.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._folders = {}
+
+    def reserve(self, folder, key, count, seed, is_taken, index_fresh=True):
+        """
+        Reserves `count` consecutive counters for `key` in `folder` and returns
+        the first one. `seed()` scans the folder and returns the next free
+        counter, `is_taken(counter)` reports whether a counter is already used.
+
+        With index_fresh=False, a key that is not indexed yet and gets counter 0
+        is not written to the index. Callers with mostly unique names (e.g. MP3
+        titles) use this so the index only grows for names that actually repeat;
+        their seed() has to be cheap for fresh names.
+        """
+        folder = os.path.normcase(os.path.abspath(folder))
+        with self._lock:
+            entries = self._load(folder)
+            start = entries.get(key)
+            indexed = start is not None
+            if start is None:
+                start = seed()
+            elif any(is_taken(c) for c in range(start, start + count)):
+                print(f"Counter index for '{key}' in {folder} drifted, rescanning")
+                start = max(seed(), start)
+            while any(is_taken(c) for c in range(start, start + count)):
+                start += 1
+            if indexed or index_fresh or start > 0:
+                entries[key] = start + count
+                self._save(folder, entries)
+        return start
+
+    def _load(self, folder):
+        entries = self._folders.get(folder)
+        if entries is None:
+            entries = {}
+            try:
+                with open(os.path.join(folder, COUNTER_INDEX_FILENAME), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                entries = {str(k): int(v) for k, v in data.items()}
+            except (OSError, ValueError, AttributeError):
+                pass
+            self._folders[folder] = entries
+        return entries
+
+    def _save(self, folder, entries):
+        path = os.path.join(folder, COUNTER_INDEX_FILENAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error: could not write counter index {path}: {e}")
+
+
+# Process-wide index shared by all save nodes
+COUNTER_INDEX = FilenameCounterIndex()
+
+
+def resolve_save_prefix(filename_prefix, output_dir, image_width=0, image_height=0):
+    """
+    Path part of folder_paths.get_save_image_path() without the counter scan.
+
+    Expands %width%/%height%/%year%/... variables, splits the prefix into
+    subfolder and filename and refuses paths outside `output_dir`. Returns
+    (full_output_folder, filename, subfolder, filename_prefix).
+    """
+    if "%" in filename_prefix:
+        now = time.localtime()
+        for var, value in (
+            ("%width%", str(image_width)),
+            ("%height%", str(image_height)),
+            ("%year%", str(now.tm_year)),
+            ("%month%", str(now.tm_mon).zfill(2)),
+            ("%day%", str(now.tm_mday).zfill(2)),
+            ("%hour%", str(now.tm_hour).zfill(2)),
+            ("%minute%", str(now.tm_min).zfill(2)),
+            ("%second%", str(now.tm_sec).zfill(2)),
+        ):
+            filename_prefix = filename_prefix.replace(var, value)
+
+    subfolder = os.path.dirname(os.path.normpath(filename_prefix))
+    filename = os.path.basename(os.path.normpath(filename_prefix))
+    full_output_folder = os.path.join(output_dir, subfolder)
+
+    if os.path.commonpath((output_dir, os.path.abspath(full_output_folder))) != output_dir:
+        raise Exception(
+            "**** ERROR: Saving image outside the output folder is not allowed."
+            f"\n full_output_folder: {os.path.abspath(full_output_folder)}"
+            f"\n         output_dir: {output_dir}"
+            f"\n         commonpath: {os.path.commonpath((output_dir, os.path.abspath(full_output_folder)))}"
+        )
+    os.makedirs(full_output_folder, exist_ok=True)
+    return full_output_folder, filename, subfolder, filename_prefix
+
+
+def scan_save_counter(folder, filename, include_subfolders=False):
+    """
+    Next free counter for `<filename>_<counter>_...` files, same rules as ComfyUI's
+    scan. With include_subfolders, shard folders one level below are scanned too.
+    """
+    prefix_len = len(filename)
+    counter = 0
+    try:
+        entries = list(os.scandir(folder))
+    except FileNotFoundError:
+        return 1
+    names = [entry.name for entry in entries]
+    if include_subfolders:
+        for entry in entries:
+            if entry.is_dir() and not entry.name.startswith("."):
+                names.extend(os.listdir(entry.path))
+    for name in names:
+        prefix = name[:prefix_len + 1]
+        if os.path.normcase(prefix[:-1]) != os.path.normcase(filename) or prefix[-1:] != "_":
+            continue
+        try:
+            digits = int(name[prefix_len + 1:].split("_")[0])
+        except ValueError:
+            digits = 0
+        counter = max(counter, digits)
+    return counter + 1
+
+
+# ---------------------------------------------------------------------------
+# Sharded output layout
+# ---------------------------------------------------------------------------
+
+SHARD_LAYOUTS = ["none", "date", "counter_bucket", "hash_prefix"]
+
+
+def shard_subfolder(layout, counter=0, name="", bucket_size=1000, date=None):
+    """
+    Relative shard folder for one output file ("" for layout "none").
+
+    date            -> "2026-03-14" (pass `date` to keep a whole batch in one folder)
+    counter_bucket  -> "000000", "001000", ... (`bucket_size` files per folder)
+    hash_prefix     -> first two hex digits of sha1(name), 256 evenly filled folders
+    """
+    if layout == "date":
+        return date or time.strftime("%Y-%m-%d")
+    if layout == "counter_bucket":
+        bucket_size = max(1, int(bucket_size))
+        return f"{(counter // bucket_size) * bucket_size:06d}"
+    if layout == "hash_prefix":
+        return hashlib.sha1(name.encode("utf-8")).hexdigest()[:2]
+    return ""
+
+
+# ---------------------------------------------------------------------------
+# WebDataset-style tar shards
+# ---------------------------------------------------------------------------
+
+_TAR_BLOCK = tarfile.BLOCKSIZE
+_TAR_END = b"\0" * (2 * _TAR_BLOCK)
+
+
+class TarShardWriter:
+    """
+    Appends samples to rolling WebDataset-style shards `<prefix>-000000.tar`,
+    `<prefix>-000001.tar`, ... in one folder.
+
+    All members of a sample share the key (`<key>.png`, `<key>.txt`, `<key>.json`)
+    and always land in the same shard. A new shard is started once the current
+    one would exceed `max_shard_bytes`. For every sample one JSON line is
+    appended to `<prefix>.index.jsonl`:
+
+        {"key": ..., "shard": "<prefix>-000003.tar",
+         "members": {"png": [data_offset, size], "txt": [...], ...}}
+
+    so readers can seek straight to a member without extracting the archive.
+    Headers are written directly (ustar/pax via tarfile.TarInfo), which keeps
+    appending O(sample) instead of re-reading every existing header.
+    """
+
+    def __init__(self, folder, prefix, max_shard_bytes):
+        self.folder = folder
+        self.prefix = prefix
+        self.max_shard_bytes = max_shard_bytes
+        self.index_path = os.path.join(folder, f"{prefix}.index.jsonl")
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+        pattern = re.compile(rf"^{re.escape(prefix)}-(\d{{6}})\.tar$")
+        shards = [int(m.group(1)) for m in map(pattern.match, os.listdir(folder)) if m]
+        self._shard = max(shards) if shards else 0
+        self._repair_index()
+        self._next_sample = self._read_next_sample()
+
+    def shard_path(self, shard):
+        return os.path.join(self.folder, f"{self.prefix}-{shard:06d}.tar")
+
+    @property
+    def current_shard_path(self):
+        return self.shard_path(self._shard)
+
+    def next_key(self):
+        """Key the next write_sample() call will use if none is given."""
+        return f"{self.prefix}_{self._next_sample:08d}"
+
+    def _repair_index(self):
+        """
+        Cuts off a truncated last line (crash during the append), so the next
+        record starts on a line of its own instead of being glued to the
+        fragment.
+        """
+        try:
+            with open(self.index_path, "r+b") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    return
+                start = max(0, size - 65536)
+                f.seek(start)
+                tail = f.read()
+                if tail.endswith(b"\n"):
+                    return
+                newline = tail.rfind(b"\n")
+                if newline >= 0:
+                    f.truncate(start + newline + 1)
+                elif start == 0:
+                    f.truncate(0)
+                else:
+                    f.write(b"\n")
+        except OSError:
+            pass
+
+    def _last_indexed_sample(self):
+        """Highest sample number in the index file: the last line that parses, -1 if none."""
+        try:
+            with open(self.index_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 65536))
+                lines = f.read().splitlines()
+        except OSError:
+            return -1
+        for line in reversed(lines):
+            try:
+                return int(json.loads(line)["sample"])
+            except (ValueError, KeyError, TypeError):
+                continue
+        return -1
+
+    def _last_shard_sample(self):
+        """
+        Highest default key (`<prefix>_<sample:08d>`) in the newest shard, -1 if
+        none. Covers samples whose index line was lost, or an unreadable index.
+        """
+        pattern = re.compile(rf"^{re.escape(self.prefix)}_(\d{{8}})\.")
+        highest = -1
+        try:
+            with tarfile.open(self.shard_path(self._shard), "r:") as tf:
+                for info in tf:
+                    m = pattern.match(info.name)
+                    if m:
+                        highest = max(highest, int(m.group(1)))
+        except (OSError, tarfile.TarError):
+            # A shard cut off mid-sample still yields the members read so far
+            pass
+        return highest
+
+    def _read_next_sample(self):
+        """
+        Continues numbering after the last sample, so keys are never reused:
+        the highest of the last parseable index line and the newest shard.
+        """
+        return max(self._last_indexed_sample(), self._last_shard_sample()) + 1
+
+    @staticmethod
+    def _sample_blobs(key, members):
+        """Tar headers and data for one sample, plus its size inside the shard."""
+        blobs = []
+        for ext, data in members.items():
+            info = tarfile.TarInfo(f"{key}.{ext}")
+            info.size = len(data)
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            blobs.append((ext, info.tobuf(format=tarfile.PAX_FORMAT), data))
+        sample_bytes = sum(
+            len(header) + len(data) + (-len(data) % _TAR_BLOCK) for _, header, data in blobs
+        )
+        return blobs, sample_bytes
+
+    def write_sample(self, members, key=None):
+        """
+        Appends one sample ({extension: bytes}) and returns its index record.
+        Without an explicit key, `<prefix>_<sample:08d>` is used. `members` may
+        also be a callable that gets the shard filename the sample is written
+        to and returns the dict, for contents that reference their own shard.
+        """
+        with self._lock:
+            sample = self._next_sample
+            key = key or self.next_key()
+            build = members if callable(members) else (lambda shard_name: members)
+
+            path = self.shard_path(self._shard)
+            blobs, sample_bytes = self._sample_blobs(key, build(os.path.basename(path)))
+            end = max(0, os.path.getsize(path) - len(_TAR_END)) if os.path.exists(path) else 0
+            if end > 0 and end + sample_bytes + len(_TAR_END) > self.max_shard_bytes:
+                self._shard += 1
+                path = self.shard_path(self._shard)
+                end = 0
+                blobs, sample_bytes = self._sample_blobs(key, build(os.path.basename(path)))
+
+            record = {"sample": sample, "key": key, "shard": os.path.basename(path), "members": {}}
+            with open(path, "r+b" if end > 0 else "wb") as f:
+                f.seek(end)
+                for ext, header, data in blobs:
+                    f.write(header)
+                    record["members"][ext] = [f.tell(), len(data)]
+                    f.write(data)
+                    f.write(b"\0" * (-len(data) % _TAR_BLOCK))
+                f.write(_TAR_END)
+                f.truncate()
+
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            self._next_sample = sample + 1
+            return record
+
+
+_tar_writers = {}
+_tar_writers_lock = threading.Lock()
+
+
+def get_tar_shard_writer(folder, prefix, max_shard_bytes):
+    """Process-wide writer per (folder, prefix); shard size changes apply immediately."""
+    key = (os.path.normcase(os.path.abspath(folder)), prefix)
+    with _tar_writers_lock:
+        writer = _tar_writers.get(key)
+        if writer is None:
+            writer = TarShardWriter(folder, prefix, max_shard_bytes)
+            _tar_writers[key] = writer
+        writer.max_shard_bytes = max_shard_bytes
+        return writer
+
+
+def read_tar_member(folder, record, ext):
+    """Reads one member of an index record by seeking into its shard."""
+    offset, size = record["members"][ext]
+    with open(os.path.join(folder, record["shard"]), "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+# ---------------------------------------------------------------------------
+# Encoder profiles
+# ---------------------------------------------------------------------------
+
+# PIL save() parameters per profile and format. "balanced" reproduces the
+# former hardcoded behaviour (PNG compress_level 4, JPEG/WEBP quality 95).
+ENCODER_PROFILES = {
+    "balanced": {
+        "PNG": {"compress_level": 4},
+        "JPEG": {"quality": 95},
+        "WEBP": {"quality": 95, "lossless": False},
+    },
+    "fastest": {
+        "PNG": {"compress_level": 1, "compress_type": zlib.Z_RLE},
+        "JPEG": {"quality": 95, "subsampling": "4:2:0", "optimize": False},
+        "WEBP": {"quality": 95, "lossless": False, "method": 0},
+    },
+    "smallest": {
+        "PNG": {"compress_level": 9, "optimize": True},
+        "JPEG": {"quality": 95, "subsampling": "4:2:0", "optimize": True, "progressive": True},
+        "WEBP": {"quality": 95, "lossless": False, "method": 6},
+    },
+    "lossless": {
+        "PNG": {"compress_level": 4},
+        "JPEG": {"quality": 100, "subsampling": "4:4:4"},
+        "WEBP": {"lossless": True, "quality": 80, "method": 4},
+    },
+}
+
+
+def encoder_params(profile, file_format):
+    """PIL save() kwargs for a profile; file_format is PNG, JPG, JPEG or WEBP."""
+    pil_format = "JPEG" if file_format in ("JPG", "JPEG") else file_format
+    return dict(ENCODER_PROFILES.get(profile, ENCODER_PROFILES["balanced"])[pil_format])
+
+
+def benchmark_encoder_profiles(frames, formats=("PNG", "JPEG", "WEBP"), profiles=None, repeats=1):
+    """
+    Encodes uint8 frames ([H,W,C] numpy arrays) in memory with every profile and
+    returns one row per (format, profile): throughput in MB/s of raw pixel data,
+    average bytes per image and total seconds. Requires PIL.
+    """
+    from PIL import Image
+
+    profiles = profiles or list(ENCODER_PROFILES)
+    images = [Image.fromarray(frame) for frame in frames]
+    raw_bytes = sum(frame.nbytes for frame in frames) * repeats
+    rows = []
+    for file_format in formats:
+        for profile in profiles:
+            params = encoder_params(profile, file_format)
+            total_bytes = 0
+            start = time.perf_counter()
+            for _ in range(repeats):
+                for img in images:
+                    if file_format in ("JPG", "JPEG") and img.mode == "RGBA":
+                        img = img.convert("RGB")
+                    buffer = io.BytesIO()
+                    img.save(buffer, format="JPEG" if file_format == "JPG" else file_format, **params)
+                    total_bytes += buffer.tell()
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            rows.append({
+                "format": file_format,
+                "profile": profile,
+                "mb_per_s": raw_bytes / 1e6 / elapsed,
+                "bytes_per_image": total_bytes / (len(images) * repeats),
+                "seconds": elapsed,
+            })
+    return rows
+
+
+def format_benchmark_table(rows):
+    """Plain-text table for benchmark_encoder_profiles() results."""
+    lines = [
+        f"{'Format':<6} {'Profile':<10} {'MB/s':>9} {'KB/image':>10} {'Seconds':>9}",
+        "-" * 48,
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['format']:<6} {row['profile']:<10} {row['mb_per_s']:>9.1f} "
+            f"{row['bytes_per_image'] / 1024:>10.1f} {row['seconds']:>9.3f}"
+        )
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Sidecar text embedded in the image file
+# ---------------------------------------------------------------------------
+
+SIDECAR_MODES = ["txt_file", "embedded", "both"]
+_EXIF_IFD = 0x8769
+_EXIF_USER_COMMENT = 0x9286
+# A JPEG APP1 marker segment holds at most 64 KB; PIL's JPEG writer refuses
+# larger EXIF blocks ("EXIF data is too long") and writes nothing at all.
+JPEG_EXIF_MAX_BYTES = 65533
+
+
+def _utf16_codec(endian):
+    return "utf-16-le" if endian == "<" else "utf-16-be"
+
+
+def build_sidecar_exif(text, max_bytes=None):
+    """
+    EXIF block (for JPEG/WEBP) carrying the sidecar text as UserComment with
+    the "UNICODE" character code, UCS-2 in the byte order PIL will write.
+    Returns None if the encoded block would exceed `max_bytes` (e.g.
+    JPEG_EXIF_MAX_BYTES), so the caller can fall back to a .txt file.
+    """
+    from PIL import Image
+
+    comment = b"UNICODE\0" + text.encode(_utf16_codec(Image.Exif().endian))
+    # Cheap pre-check on the raw comment before building the whole block
+    if max_bytes is not None and len(comment) > max_bytes:
+        return None
+    exif = Image.Exif()
+    exif.get_ifd(_EXIF_IFD)[_EXIF_USER_COMMENT] = comment
+    if max_bytes is not None and len(exif.tobytes()) > max_bytes:
+        return None
+    return exif
+
+
+def read_embedded_sidecar(path):
+    """
+    Returns the sidecar text embedded by the save node (PNG iTXt chunk or
+    JPEG/WEBP EXIF UserComment), or None. Pixel data is never decoded.
+    """
+    with open(path, "rb") as f:
+        is_png = f.read(8) == PNG_SIGNATURE
+    if is_png:
+        return read_png_text_chunks(path).get(SIDECAR_PNG_KEY)
+
+    from PIL import Image
+
+    with Image.open(path) as img:
+        exif = img.getexif()
+        comment = exif.get_ifd(_EXIF_IFD).get(_EXIF_USER_COMMENT)
+        endian = exif.endian
+    if not comment:
+        return None
+    if isinstance(comment, str):
+        return comment
+    code, data = bytes(comment[:8]), bytes(comment[8:])
+    if code == b"UNICODE\0":
+        return data.decode(_utf16_codec(endian))
+    return data.rstrip(b"\0").decode("utf-8", errors="replace")
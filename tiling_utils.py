@@ -0,0 +1,153 @@
+# ComfyUI - Tiling Helpers - Elmar Krüger - 2026
+#
+# Shared overlap-add infrastructure for tiled processing: window functions,
+# weighted accumulation into preallocated buffers and the final normalization.
+# Used by VAEDecodeAudioTiled (1D) in latent_nodes.py and by tiled_process_2d
+# for image tensors. Depends only on torch, no ComfyUI import required.
+import math
+
+import torch
+
+
+# Positions whose accumulated window weight is below this value are left
+# untouched by normalize_overlap_add (e.g. the first sample of a Hann window).
+WEIGHT_EPS = 1e-6
+
+
+def hann_window(length, device="cpu"):
+    """Periodic Hann window of `length` samples (as used by the audio tiler)."""
+    return torch.hann_window(length, device=device)
+
+
+def feather_window(length, ramp_before, ramp_after, device="cpu", dtype=torch.float32):
+    """
+    1D feathering window: 1.0 in the interior, raised-cosine (half Hann) ramps
+    of `ramp_before` / `ramp_after` samples at the edges that overlap a
+    neighbouring tile. Ramps never reach zero, so edges that touch the border of
+    the image (ramp length 0) keep full weight and every position gets a
+    positive total weight.
+    """
+    window = torch.ones(length, device=device, dtype=dtype)
+    for ramp, reverse in ((min(ramp_before, length), False), (min(ramp_after, length), True)):
+        if ramp <= 0:
+            continue
+        steps = (torch.arange(ramp, device=device, dtype=torch.float64) + 0.5) / ramp
+        values = (0.5 - 0.5 * torch.cos(math.pi * steps)).to(dtype)
+        if reverse:
+            window[length - ramp:] *= values.flip(0)
+        else:
+            window[:ramp] *= values
+    return window
+
+
+def accumulate_tile(output, weights, tile, window, index):
+    """
+    Overlap-add one tile: output[index] += tile * window, weights[index] += window.
+
+    `index` is a tuple of slices valid for both buffers; `weights` may use
+    size-1 dimensions (e.g. batch/channels) that broadcast against `output`,
+    `window` has to broadcast against `tile`.
+    """
+    output[index] += tile * window
+    weights[index] += window
+
+
+def normalize_overlap_add(output, weights, eps=WEIGHT_EPS):
+    """
+    In-place division of the accumulated output by the accumulated weights.
+    Positions with weight <= eps are divided by 1 (i.e. left as they are), which
+    matches `output[mask] /= weights[mask]` without materializing full-size masks.
+    """
+    output /= torch.where(weights > eps, weights, torch.ones_like(weights))
+    return output
+
+
+def tile_starts(total, tile_size, overlap):
+    """
+    Start offsets of overlapping tiles along one axis. All tiles have the full
+    `tile_size` (the last one is shifted back to end at `total`) unless the axis
+    is shorter than a single tile.
+    """
+    if total <= tile_size:
+        return [0]
+    stride = max(1, tile_size - overlap)
+    starts = list(range(0, total - tile_size + 1, stride))
+    if starts[-1] + tile_size < total:
+        starts.append(total - tile_size)
+    return starts
+
+
+def tiled_process_2d(tensor, fn, tile_size=512, overlap=64, layout="BHWC", scale=1, output_device=None):
+    """
+    Runs `fn` over overlapping 2D tiles of `tensor` and merges the results with
+    feathered windows into one preallocated output.
+
+    Args:
+        tensor (torch.Tensor): [B,H,W,C] image (layout "BHWC") or [B,C,H,W]
+            latent (layout "BCHW").
+        fn (callable): Tile -> processed tile in the same layout. The spatial
+            size of the result must be `scale` times the input tile; batch and
+            channel count may differ from the input (e.g. a VAE decode).
+        tile_size (int): Tile edge length in input pixels.
+        overlap (int): Overlap between neighbouring tiles in input pixels.
+        layout (str): "BHWC" or "BCHW".
+        scale (int): Spatial scale factor between input and output.
+        output_device: Device of the merged output (default: input device).
+
+    Returns:
+        torch.Tensor: float32 tensor in `layout`, spatial size H*scale x W*scale.
+    """
+    if layout not in ("BHWC", "BCHW"):
+        raise ValueError(f"Unsupported layout '{layout}', expected 'BHWC' or 'BCHW'")
+    tile_size = max(1, int(tile_size))
+    overlap = max(0, min(int(overlap), tile_size - 1))
+    h_dim, w_dim = (1, 2) if layout == "BHWC" else (2, 3)
+    height, width = tensor.shape[h_dim], tensor.shape[w_dim]
+    device = output_device if output_device is not None else tensor.device
+
+    ys = tile_starts(height, tile_size, overlap)
+    xs = tile_starts(width, tile_size, overlap)
+
+    def spatial_index(y0, y1, x0, x1):
+        index = [slice(None)] * 4
+        index[h_dim], index[w_dim] = slice(y0, y1), slice(x0, x1)
+        return tuple(index)
+
+    def ramps(starts, i, tile_len):
+        # Feather only towards neighbouring tiles; the actual overlap can be
+        # larger than `overlap` for the last (shifted) tile.
+        before = starts[i - 1] + tile_len - starts[i] if i > 0 else 0
+        after = starts[i] + tile_len - starts[i + 1] if i + 1 < len(starts) else 0
+        return max(0, before) * scale, max(0, after) * scale
+
+    output = weights = None
+    for yi, y0 in enumerate(ys):
+        th = min(tile_size, height - y0)
+        ramp_top, ramp_bottom = ramps(ys, yi, th)
+        window_y = feather_window(th * scale, ramp_top, ramp_bottom, device=device)
+        for xi, x0 in enumerate(xs):
+            tw = min(tile_size, width - x0)
+            result = fn(tensor[spatial_index(y0, y0 + th, x0, x0 + tw)])
+            result = result.to(device=device, dtype=torch.float32)
+
+            if output is None:
+                # Output and weights are allocated once, after the first tile
+                # tells us batch and channel count of the processed result.
+                out_shape = list(result.shape)
+                out_shape[h_dim], out_shape[w_dim] = height * scale, width * scale
+                output = torch.zeros(out_shape, dtype=torch.float32, device=device)
+                weight_shape = [1] * 4
+                weight_shape[h_dim], weight_shape[w_dim] = height * scale, width * scale
+                weights = torch.zeros(weight_shape, dtype=torch.float32, device=device)
+
+            ramp_left, ramp_right = ramps(xs, xi, tw)
+            window_x = feather_window(tw * scale, ramp_left, ramp_right, device=device)
+            window_shape = [1] * 4
+            window_shape[h_dim], window_shape[w_dim] = th * scale, tw * scale
+            window = (window_y[:, None] * window_x[None, :]).view(window_shape)
+
+            index = spatial_index(y0 * scale, (y0 + th) * scale, x0 * scale, (x0 + tw) * scale)
+            accumulate_tile(output, weights, result, window, index)
+            del result
+
+    return normalize_overlap_add(output, weights)